@@ -0,0 +1,3 @@
+-- Migration: Index jobs by creation time for the paged job export
+
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at, id);
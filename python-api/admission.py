@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+
+# Per-user admission control for job creation: a token bucket limits the rate of new
+# jobs and a cap limits how many of a user's jobs can be queued or running at once.
+
+SEARCH_RATE_PER_SECOND = float(os.environ.get("SEARCH_RATE_PER_SECOND", "0.5"))
+SEARCH_BURST = int(os.environ.get("SEARCH_BURST", "5"))
+MAX_JOBS_IN_FLIGHT_PER_USER = int(os.environ.get("MAX_JOBS_IN_FLIGHT_PER_USER", "2"))
+PRUNE_ABOVE = 10000
+
+
+class Rejected(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, rate=SEARCH_RATE_PER_SECOND, burst=SEARCH_BURST, max_in_flight=MAX_JOBS_IN_FLIGHT_PER_USER):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self._buckets = {}  # user_id -> (tokens, last refill time)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, user_id):
+        """Admits one job for user_id or raises Rejected, call release() when the job is done"""
+        now = time.monotonic()
+        with self._lock:
+            if self._in_flight.get(user_id, 0) >= self.max_in_flight:
+                raise Rejected(f"Too many jobs in flight (max {self.max_in_flight})", 1.0)
+            tokens, last = self._buckets.get(user_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[user_id] = (tokens, now)
+                raise Rejected("Rate limit exceeded", (1 - tokens) / self.rate)
+            self._buckets[user_id] = (tokens - 1, now)
+            self._in_flight[user_id] = self._in_flight.get(user_id, 0) + 1
+            if len(self._buckets) > PRUNE_ABOVE:
+                self._prune(now)
+
+    def release(self, user_id):
+        with self._lock:
+            count = self._in_flight.get(user_id, 0) - 1
+            if count > 0:
+                self._in_flight[user_id] = count
+            else:
+                self._in_flight.pop(user_id, None)
+
+    def in_flight(self, user_id):
+        with self._lock:
+            return self._in_flight.get(user_id, 0)
+
+    def _prune(self, now):
+        # Users whose bucket has refilled and who have nothing running hold no state
+        for user_id, (tokens, last) in list(self._buckets.items()):
+            if user_id not in self._in_flight and tokens + (now - last) * self.rate >= self.burst:
+                del self._buckets[user_id]
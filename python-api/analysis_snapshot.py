@@ -0,0 +1,148 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import date
+import numpy as np
+
+import cross_section
+import feature_engine
+
+# Immutable, memory-mapped snapshot of one day's analysis, shared by all uvicorn workers.
+# Layout: 40 byte header | float32 predictions[n] | uint32 ranks[n] | float32 percentiles[n]
+#         | float32 zscores[n] | float32 changes[n] | float32 mean_return[n]
+#         | float32 volatility[n] | float32 momentum[n] | "\n"-joined utf-8 tickers
+# The header carries the version of the model that scored the predictions (version 1
+# files have none). The cross-sectional stats (see cross_section.py) are computed once
+# when the snapshot is written, version 1 and 2 files get them computed on load. The
+# rolling features come from the feature engine, they are NaN in files before version 4.
+# Files are written to a temp file and renamed into place, so readers never see half a file.
+
+MAGIC = b"ANLSNAP1"
+VERSION = 4
+HEADER = struct.Struct("<8sIIq16s")
+HEADER_V1 = struct.Struct("<8sIIq8x")
+STAT_DTYPES = {"ranks": np.uint32, "percentiles": np.float32, "zscores": np.float32, "changes": np.float32}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class Snapshot:
+    def __init__(self, mm):
+        magic, version = struct.unpack_from("<8sI", mm, 0)
+        if magic != MAGIC or version not in (1, 2, 3, VERSION):
+            raise ValueError("Not an analysis snapshot")
+        if version == 1:
+            header = HEADER_V1
+            _, _, n, day = HEADER_V1.unpack_from(mm, 0)
+            self.model_version = None
+        else:
+            header = HEADER
+            _, _, n, day, model_version = HEADER.unpack_from(mm, 0)
+            self.model_version = model_version.rstrip(b"\0").decode("ascii") or None
+        self.date = date.fromordinal(day)
+        # Read-only views straight into the mapping, no copy
+        offset = header.size
+        self.predictions = np.frombuffer(mm, dtype=np.float32, count=n, offset=offset)
+        offset += 4 * n
+        if version >= 3:
+            for field in cross_section.FIELDS:
+                setattr(self, field, np.frombuffer(mm, dtype=STAT_DTYPES[field], count=n, offset=offset))
+                offset += 4 * n
+        for field in feature_engine.FEATURES:
+            if version == VERSION:
+                setattr(self, field, np.frombuffer(mm, dtype=np.float32, count=n, offset=offset))
+                offset += 4 * n
+            else:
+                setattr(self, field, np.full(n, np.nan, dtype=np.float32))
+        names = mm[offset:]
+        self.tickers = tuple(names.decode("utf-8").split("\n")) if n else ()
+        if version < 3:
+            for field, values in cross_section.compute(self.tickers, self.predictions).items():
+                setattr(self, field, values)
+        self._mm = mm
+
+    def __len__(self):
+        return len(self.tickers)
+
+
+def write_snapshot(path, day, tickers, predictions, model_version=None, previous=None, features=None):
+    """Atomically publishes a new snapshot at path, previous is the (tickers, predictions)
+    the day-over-day change is computed against and features the rolling features aligned
+    with tickers (NaN if None)"""
+    predictions = np.asarray(predictions, dtype=np.float32)
+    stats = cross_section.compute(tickers, predictions, previous)
+    names = "\n".join(tickers).encode("utf-8")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(predictions), day.toordinal(), (model_version or "").encode("ascii")))
+        f.write(predictions.tobytes())
+        for field in cross_section.FIELDS:
+            f.write(stats[field].astype(STAT_DTYPES[field]).tobytes())
+        for field in feature_engine.FEATURES:
+            values = features[field] if features is not None else np.full(len(predictions), np.nan)
+            f.write(np.asarray(values, dtype=np.float32).tobytes())
+        f.write(names)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    """Returns the current Snapshot at path (or None), re-mapping only when the file was replaced"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (st.st_ino, st.st_mtime_ns)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        snapshot = Snapshot(mm)
+        # Older mappings stay alive for readers still holding them
+        _cache[path] = (key, snapshot)
+        return snapshot
+
+
+def write_atomic(path, write):
+    """Calls write(f) on a temp file and renames it over path"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def append_line(path, line):
+    # A single O_APPEND write, so concurrent workers never interleave lines
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, (line + "\n").encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def refresh_lease(lock_path):
+    """Yields True in the one process (and thread) that holds the refresh lock, False elsewhere"""
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
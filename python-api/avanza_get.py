@@ -3,24 +3,27 @@ import requests
 from concurrent.futures import ThreadPoolExecutor
 import time
 from queue import Queue
-from datetime import datetime
-import json
+from datetime import datetime, timedelta
 from tqdm import tqdm
 import os
-# Set working directory to this file's directory
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+import cancellation
+import profiling
+import symbol_index
+import ticker_status
 
-with open('yf_af_matching/sp500_ticker_to_af_id.json', 'r') as f:
-    sp_500_ticker_to_af_id = json.load(f)
+MIN_HISTORY_DAYS = 730  # 365*2 days
 
-with open('yf_af_matching/af_id_to_sp500_ticker.json', 'r') as f:
-    af_id_to_sp500_ticker = json.load(f)
+class IneligibleTicker(Exception):
+    def __init__(self, message, until):
+        super().__init__(message)
+        self.until = until
 
 def make_request(url, ticker):
     try:
         if ticker is None:
             return None
-        response = requests.get(url, timeout=10)
+        # A job's deadline caps the request timeout
+        response = requests.get(url, timeout=cancellation.timeout(10))
         assert response.status_code == 200
         assert response.json()['metadata']['resolution']['chartResolution'] == 'day'
         assert response.json()['metadata']['resolution']['chartResolution'] == 'day'
@@ -30,27 +33,42 @@ def make_request(url, ticker):
         date_to = datetime.strptime(to_, '%Y-%m-%d')
         # Check that we have at least 2 years of data
         time_diff = date_to - date_from
-        if time_diff.days < 730:  # 365*2 days
-            raise Exception(f"Not enough data - only {time_diff.days} days available")
+        if time_diff.days < MIN_HISTORY_DAYS:
+            # Will have enough history once it has traded for two years
+            raise IneligibleTicker(f"Not enough data - only {time_diff.days} days available",
+                                   date_from.date() + timedelta(days=MIN_HISTORY_DAYS))
         # Print time difference between from and to dates
 
-        opening_prices = response.json()['ohlc']
-        opening_prices = [float(x['open']) for x in opening_prices]
+        ohlc = response.json()['ohlc']
+        opening_prices = [float(x['open']) for x in ohlc]
+        # Bar timestamps let the feature engine push only bars it has not seen yet
+        timestamps = [int(x['timestamp']) for x in ohlc] if all('timestamp' in x for x in ohlc) else None
 
-        return ticker, opening_prices
+        ticker_status.mark_ok(ticker)
+        return ticker, opening_prices, timestamps
+    except IneligibleTicker as e:
+        print(f"Skipping {ticker} until {e.until}: {str(e)}")
+        ticker_status.mark_ineligible(ticker, str(e), e.until)
+        return None
     except Exception as e:
+        # A timeout caused by the job's deadline is not the ticker's fault
+        cancellation.checkpoint()
         print(f"Error making request to {url} for {ticker}: {str(e)}")
+        ticker_status.mark_failed(ticker, str(e))
         return None
 
 def process_urls(template_url, replacements, max_threads=500):
     results = []
     
     for replacement in tqdm(replacements, desc="Downloading prices"):
+        cancellation.checkpoint()
         try:
-            ticker = af_id_to_sp500_ticker.get(str(replacement))
+            ticker = symbol_index.ticker(replacement) if replacement is not None else None
             url = template_url.replace("{PLACEHOLDER}", str(replacement))
             result = make_request(url, ticker)
             results.append(result)
+        except cancellation.Cancelled:
+            raise
         except Exception as e:
             results.append([None, None])
             print(f"Error processing {replacement}: {str(e)}")
@@ -63,25 +81,32 @@ def process_urls(template_url, replacements, max_threads=500):
 def get_af_from_tickers(tickers_list):
     af_ids = []
     for ticker in tickers_list:
-        if ticker in sp_500_ticker_to_af_id:
-            af_ids.append(sp_500_ticker_to_af_id[ticker])
-        else:
-            af_ids.append(None)
+        af_ids.append(symbol_index.orderbook_id(ticker))
     return af_ids
 
+@profiling.profiled("download_prices")
 def download_prices(af_ids):
     template_url = "https://www.avanza.se/_api/price-chart/stock/{PLACEHOLDER}?timePeriod=three_years&resolution=day"
     opening_price_lists = process_urls(template_url, af_ids)
     return opening_price_lists
 
 def get_prices_from_tickers(tickers_list):
+    # Known-ineligible tickers are not downloaded, they come back as None like failed ones
+    skip = ticker_status.ineligible_tickers()
     af_ids = get_af_from_tickers(tickers_list)
-    opening_price_lists = download_prices(af_ids)
+    # Status updates for the whole download are written in one transaction
+    with ticker_status.batch():
+        for idx, (ticker, af_id) in enumerate(zip(tickers_list, af_ids)):
+            if ticker in skip:
+                af_ids[idx] = None
+            elif af_id is None:
+                ticker_status.mark_no_mapping(ticker)
+        opening_price_lists = download_prices(af_ids)
     return opening_price_lists
 
 if __name__ == "__main__":
 
-    with open('tickers_test.txt', 'r') as f:
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tickers_test.txt'), 'r') as f:
         tickers = [line.strip() for line in f]
     af_ids = get_af_from_tickers(tickers[:3])
     print(af_ids)
@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+
+# Startup benchmark: import time and RSS of each module in a fresh interpreter,
+# checked against the budgets in startup_budget.json.
+# Usage: python bench_startup.py [--update]  (--update writes the measured values + 50% as new budgets)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BUDGET_PATH = os.path.join(BASE_DIR, "startup_budget.json")
+MODULES = ["main", "ticker_analysis", "symbol_index", "avanza_get", "infer"]
+RUNS = 3
+
+MEASURE = '''
+import resource, sys, time
+sys.path.insert(0, {base_dir!r})
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed * 1000, after / 1024, (after - before) / 1024)
+'''
+
+
+def measure(module):
+    best = None
+    for _ in range(RUNS):
+        out = subprocess.run([sys.executable, "-c", MEASURE.format(base_dir=BASE_DIR, module=module)],
+                             capture_output=True, text=True, cwd=BASE_DIR, env={**os.environ, "PREWARM_ENABLED": "0"})
+        if out.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{out.stderr}")
+        import_ms, rss_mb, delta_mb = map(float, out.stdout.split()[-3:])
+        if best is None or import_ms < best["import_ms"]:
+            best = {"import_ms": import_ms, "rss_mb": rss_mb, "delta_rss_mb": delta_mb}
+    return best
+
+
+if __name__ == "__main__":
+    budgets = {}
+    if os.path.exists(BUDGET_PATH):
+        with open(BUDGET_PATH, "r") as f:
+            budgets = json.load(f)
+
+    results = {}
+    failed = False
+    print(f"{'module':<18}{'import ms':>12}{'rss MB':>10}{'+rss MB':>10}  budget")
+    for module in MODULES:
+        result = results[module] = measure(module)
+        budget = budgets.get(module)
+        status = ""
+        if budget:
+            over = [key for key in ("import_ms", "rss_mb") if result[key] > budget[key]]
+            status = "OVER " + ", ".join(over) if over else "ok"
+            failed = failed or bool(over)
+        print(f"{module:<18}{result['import_ms']:>12.1f}{result['rss_mb']:>10.1f}{result['delta_rss_mb']:>10.1f}  {status}")
+
+    if "--update" in sys.argv:
+        with open(BUDGET_PATH, "w") as f:
+            json.dump({module: {"import_ms": round(r["import_ms"] * 1.5), "rss_mb": round(r["rss_mb"] * 1.5)}
+                       for module, r in results.items()}, f, indent=4)
+        print(f"Budgets written to {BUDGET_PATH}")
+    elif failed:
+        sys.exit(1)
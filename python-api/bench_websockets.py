@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import loadtest
+
+# Memory per idle WebSocket subscriber: starts the stub server from loadtest.py, opens
+# idle authenticated connections in steps and reports the server's RSS growth per
+# connection, then times one job update fanned out to all of them.
+#
+#   python bench_websockets.py --steps 1000,5000,10000
+#   python bench_websockets.py --steps 1000,5000 --deflate   # with per-message deflate
+
+
+async def _subscriber(url, token, client_id, received, ready):
+    import websockets
+    try:
+        async with websockets.connect(f"{url}/data-api/ws/{client_id}?token={token}", open_timeout=60,
+                                      ping_interval=None) as ws:
+            ready.append(client_id)
+            async for message in ws:
+                if '"ping"' in message:
+                    await ws.send('{"type": "pong"}')
+                elif '"job_update"' in message:
+                    received.append(time.perf_counter())
+    except Exception:
+        pass
+
+
+async def bench(base_url, pid, steps, ramp):
+    import httpx
+    loadtest._raise_fd_limit()
+    ws_url = base_url.replace("http", "ws", 1)
+    token = loadtest._token(1)
+    received, ready, tasks = [], [], []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await client.get("/data-api/analyze")
+        await asyncio.sleep(1)
+        base_rss = loadtest._rss_mb(pid)
+        print(f"server rss with no connections: {base_rss} MB")
+        print(f"{'connections':>12}{'rss MB':>10}{'bytes/conn':>12}")
+        for target in steps:
+            while len(tasks) < target:
+                for _ in range(min(ramp, target - len(tasks))):
+                    tasks.append(asyncio.create_task(
+                        _subscriber(ws_url, token, f"bench-{len(tasks)}", received, ready)))
+                await asyncio.sleep(1)
+            while len(ready) < target and any(not task.done() for task in tasks):
+                await asyncio.sleep(0.5)
+            await asyncio.sleep(2)
+            rss = loadtest._rss_mb(pid)
+            print(f"{len(ready):>12}{rss:>10}{(rss - base_rss) * 1024 * 1024 / max(len(ready), 1):>12,.0f}")
+
+        # One job produces a few updates, time the first one reaching every subscriber
+        start = time.perf_counter()
+        await client.post("/data-api/search", json={"text": "a"}, headers={"Authorization": f"Bearer {token}"})
+        deadline = time.time() + 60
+        while len(received) < len(ready) and time.time() < deadline:
+            await asyncio.sleep(0.05)
+        if received:
+            first = sorted(received)[:len(ready)]
+            print(f"fan-out of one update to {len(first)} subscribers: "
+                  f"first after {(first[0] - start) * 1000:.1f} ms, last after {(first[-1] - start) * 1000:.1f} ms")
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server memory per idle WebSocket subscriber and fan-out time")
+    parser.add_argument("--steps", default="1000,5000,10000")
+    parser.add_argument("--ramp", type=int, default=1000, help="Connections opened per second")
+    parser.add_argument("--deflate", action="store_true", help="Enable per-message deflate on the server")
+    args = parser.parse_args()
+
+    env = dict(os.environ, WS_PER_MESSAGE_DEFLATE="1" if args.deflate else "0")
+    port = loadtest._free_port()
+    workdir = tempfile.mkdtemp(prefix="bench-ws-")
+    server = subprocess.Popen([sys.executable, loadtest.__file__, "serve", "--port", str(port), "--workdir", workdir],
+                              env=env)
+    try:
+        loadtest.wait_for_port(port, server)
+        asyncio.run(bench(f"http://127.0.0.1:{port}", server.pid, [int(s) for s in args.steps.split(",")], args.ramp))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
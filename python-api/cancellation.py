@@ -0,0 +1,73 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Cooperative cancellation for jobs. A job's worker thread binds a CancelToken, and the
+# long-running stages (the price download loop, the analysis wait, inference) call
+# checkpoint() between units of work. checkpoint() raises Cancelled once the token was
+# cancelled or its deadline passed, and is a no-op on threads without a token (prewarm,
+# scripts). Network timeouts are clamped to the time left with timeout(). The analysis
+# refresh shared by a process' jobs runs on its own thread with its own token, a job only
+# waits for it, and the refresh is cancelled once no job waits anymore.
+
+
+class Cancelled(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status  # Terminal job status, "cancelled" or "timed_out"
+
+
+class CancelToken:
+    def __init__(self, timeout_seconds=None):
+        self.deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def remaining(self):
+        """Seconds until the deadline, None without one"""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled("cancelled", "Job was cancelled")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise Cancelled("timed_out", "Job deadline exceeded")
+
+
+_local = threading.local()
+
+
+@contextmanager
+def bound(token):
+    """Makes token the current one for checkpoints on this thread"""
+    previous = getattr(_local, "token", None)
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def current():
+    return getattr(_local, "token", None)
+
+
+def checkpoint():
+    token = getattr(_local, "token", None)
+    if token is not None:
+        token.check()
+
+
+def timeout(default):
+    """default seconds, or less if the current token's deadline is closer"""
+    token = getattr(_local, "token", None)
+    remaining = token.remaining() if token is not None else None
+    if remaining is None:
+        return default
+    return max(min(default, remaining), 0.001)
@@ -0,0 +1,65 @@
+import numpy as np
+
+# Cross-sectional statistics of one day's predictions, computed in a few vectorized passes
+# over the whole universe when a snapshot is published, so requests only read them.
+#   rank        1 = highest prediction, same order as the /data-api/analyze ranking
+#   percentile  0-100, share of the universe scoring below (ties count half)
+#   zscore      (prediction - mean) / std over the universe
+#   change      prediction minus the ticker's prediction in the previous snapshot
+# Tickers without a finite prediction get rank after all others and NaN for the rest.
+
+FIELDS = ("ranks", "percentiles", "zscores", "changes")
+
+
+def ranking_order(predictions):
+    # Descending, non-finite values last, ties keep snapshot order
+    keys = np.where(np.isfinite(predictions), predictions, -np.inf)
+    return np.argsort(-keys, kind="stable")
+
+
+def compute(tickers, predictions, previous=None):
+    """Stats for predictions (aligned with tickers). previous is (tickers, predictions)
+    of the prior snapshot, or None. Returns a dict of FIELDS arrays."""
+    predictions = np.asarray(predictions, dtype=np.float64)
+    n = len(predictions)
+    finite = np.isfinite(predictions)
+
+    ranks = np.empty(n, dtype=np.uint32)
+    ranks[ranking_order(predictions)] = np.arange(1, n + 1, dtype=np.uint32)
+
+    percentiles = np.full(n, np.nan)
+    zscores = np.full(n, np.nan)
+    values = predictions[finite]
+    if len(values):
+        ordered = np.sort(values)
+        below = np.searchsorted(ordered, values, side="left")
+        equal = np.searchsorted(ordered, values, side="right") - below
+        percentiles[finite] = 100.0 * (below + 0.5 * equal) / len(values)
+        std = values.std()
+        zscores[finite] = (values - values.mean()) / std if std > 0 else 0.0
+
+    changes = np.full(n, np.nan)
+    if previous is not None and n:
+        previous_tickers, previous_predictions = previous
+        position = {ticker: i for i, ticker in enumerate(previous_tickers)}
+        index = np.fromiter((position.get(ticker, -1) for ticker in tickers), dtype=np.int64, count=n)
+        known = index >= 0
+        changes[known] = predictions[known] - np.asarray(previous_predictions, dtype=np.float64)[index[known]]
+
+    return {
+        "ranks": ranks,
+        "percentiles": percentiles.astype(np.float32),
+        "zscores": zscores.astype(np.float32),
+        "changes": changes.astype(np.float32),
+    }
+
+
+def previous_of(snapshot, day):
+    """The (tickers, predictions) a snapshot for day should be compared with, given the
+    snapshot it replaces. A same-day replacement (repair, rescore) keeps the earlier base."""
+    if snapshot is None or snapshot.date > day:
+        return None
+    if snapshot.date < day:
+        return snapshot.tickers, snapshot.predictions
+    # prediction - change is the previous day's prediction, NaN where there was none
+    return snapshot.tickers, snapshot.predictions.astype(np.float64) - snapshot.changes
@@ -0,0 +1,193 @@
+import os
+import threading
+import numpy as np
+
+# Rolling per-ticker state over the daily opening prices. Each ticker keeps a ring buffer
+# of its last WINDOW prices plus running sums of the returns inside that window, so a new
+# bar is an O(1) update and the model inputs and extra features for the whole universe
+# come out of one vectorized pass, without rescanning any history.
+
+WINDOW = 55
+STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feature_state.npz")
+EPS = 0.000000000001  # Same offset as infer.infer
+FEATURES = ("mean_return", "volatility", "momentum")
+
+
+class FeatureEngine:
+    def __init__(self, window=WINDOW, capacity=1024):
+        self.window = window
+        self.index = {}
+        self.prices = np.zeros((capacity, window))
+        self.head = np.zeros(capacity, dtype=np.int64)   # Slot the next price goes to
+        self.count = np.zeros(capacity, dtype=np.int64)  # Prices seen, capped at window
+        self.last_ts = np.full(capacity, -1, dtype=np.int64)
+        self.sum_r = np.zeros(capacity)
+        self.sum_r2 = np.zeros(capacity)
+        self.lock = threading.Lock()
+        self.stat = None  # (mtime, size) of STATE_PATH when this engine last loaded or saved it
+
+    def _row(self, ticker):
+        row = self.index.get(ticker)
+        if row is None:
+            row = len(self.index)
+            if row == len(self.head):
+                self._grow()
+            self.index[ticker] = row
+        return row
+
+    def _grow(self):
+        capacity = 2 * len(self.head)
+        extra = capacity - len(self.head)
+        self.prices = np.vstack((self.prices, np.zeros((extra, self.window))))
+        self.head = np.concatenate((self.head, np.zeros(extra, dtype=np.int64)))
+        self.count = np.concatenate((self.count, np.zeros(extra, dtype=np.int64)))
+        self.last_ts = np.concatenate((self.last_ts, np.full(extra, -1, dtype=np.int64)))
+        self.sum_r = np.concatenate((self.sum_r, np.zeros(extra)))
+        self.sum_r2 = np.concatenate((self.sum_r2, np.zeros(extra)))
+
+    def _reset(self, row):
+        self.head[row] = 0
+        self.count[row] = 0
+        self.last_ts[row] = -1
+        self.sum_r[row] = 0.0
+        self.sum_r2[row] = 0.0
+
+    def _push(self, row, price):
+        w = self.window
+        head = self.head[row]
+        count = self.count[row]
+        if count:
+            prev = self.prices[row, (head - 1) % w] + EPS
+            r = (price + EPS - prev) / prev
+            self.sum_r[row] += r
+            self.sum_r2[row] += r * r
+        if count == w:
+            # The oldest return in the window drops out with the oldest price
+            oldest = self.prices[row, head] + EPS
+            r_out = (self.prices[row, (head + 1) % w] + EPS - oldest) / oldest
+            self.sum_r[row] -= r_out
+            self.sum_r2[row] -= r_out * r_out
+        else:
+            self.count[row] = count + 1
+        self.prices[row, head] = price
+        self.head[row] = (head + 1) % w
+
+    def update(self, ticker, prices, timestamps=None):
+        """Feeds a ticker's price history, only bars newer than the last one seen are pushed"""
+        with self.lock:
+            row = self._row(ticker)
+            if timestamps is None or self.last_ts[row] < 0:
+                new = len(prices)
+                self._reset(row)
+            else:
+                timestamps = np.asarray(timestamps, dtype=np.int64)
+                seen = np.searchsorted(timestamps, self.last_ts[row], side="right")
+                # History was adjusted (split, correction) or does not reach back to our last bar: rebuild
+                if seen == 0 or prices[seen - 1] != self.prices[row, (self.head[row] - 1) % self.window]:
+                    self._reset(row)
+                    new = len(prices)
+                else:
+                    new = len(prices) - seen
+                    if new > self.window:
+                        # Too many bars missed to continue the window, start over from the newest ones
+                        self._reset(row)
+            for price in prices[len(prices) - min(new, self.window):]:
+                self._push(row, float(price))
+            if timestamps is not None and len(timestamps):
+                self.last_ts[row] = timestamps[-1]
+
+    def windows(self, tickers):
+        """(N, window) prices oldest first for tickers with a full window, and the tickers used"""
+        with self.lock:
+            rows = [self.index.get(t) for t in tickers]
+            used = [t for t, row in zip(tickers, rows) if row is not None and self.count[row] == self.window]
+            rows = np.array([self.index[t] for t in used], dtype=np.int64)
+            order = (self.head[rows, None] + np.arange(self.window)) % self.window
+            return self.prices[rows[:, None], order], used
+
+    def rolling(self, tickers):
+        """FEATURES over each ticker's window from the running sums, aligned with tickers,
+        NaN for tickers without a full window"""
+        with self.lock:
+            rows = np.array([self.index.get(t, -1) for t in tickers], dtype=np.int64)
+            full = rows >= 0
+            full[full] = self.count[rows[full]] == self.window
+            rows = rows[full]
+            n = self.window - 1
+            mean = self.sum_r[rows] / n
+            volatility = np.sqrt(np.maximum(self.sum_r2[rows] / n - mean * mean, 0.0))
+            oldest = self.prices[rows, self.head[rows]]
+            newest = self.prices[rows, (self.head[rows] - 1) % self.window]
+        features = {}
+        for name, values in zip(FEATURES, (mean, volatility, newest / (oldest + EPS) - 1)):
+            features[name] = np.full(len(tickers), np.nan)
+            features[name][full] = values
+        return features
+
+    def features(self, tickers):
+        """Model inputs (pct change, first column 0, as infer.prepare_batch) and rolling features,
+        one row per ticker used"""
+        windows, used = self.windows(tickers)
+        inputs = np.zeros(windows.shape, dtype=np.float32)
+        shifted = windows + EPS
+        inputs[:, 1:] = (shifted[:, 1:] - shifted[:, :-1]) / shifted[:, :-1]
+        return inputs, self.rolling(used), used
+
+    def save(self, path=None):
+        path = path or STATE_PATH
+        with self.lock:
+            n = len(self.index)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp_path, tickers=np.array(list(self.index), dtype=str), prices=self.prices[:n],
+                     head=self.head[:n], count=self.count[:n], last_ts=self.last_ts[:n],
+                     sum_r=self.sum_r[:n], sum_r2=self.sum_r2[:n])
+            os.replace(tmp_path, path)
+            self.stat = _stat(path)
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or STATE_PATH
+        engine = cls()
+        engine.stat = _stat(path)
+        if engine.stat is None:
+            return engine
+        state = np.load(path)
+        if state["prices"].shape[1:] != (engine.window,):
+            return engine
+        n = len(state["tickers"])
+        while len(engine.head) < n:
+            engine._grow()
+        engine.index = {ticker: row for row, ticker in enumerate(state["tickers"].tolist())}
+        for name in ("prices", "head", "count", "last_ts", "sum_r", "sum_r2"):
+            getattr(engine, name)[:n] = state[name]
+        return engine
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Process-wide engine, restored from STATE_PATH on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = FeatureEngine.load()
+        return _engine
+
+
+def reload():
+    """Process-wide engine, re-read from STATE_PATH if another worker saved it since. Called by
+    the refresh lease holder, whose own engine may still hold the bars of an older refresh."""
+    global _engine
+    with _engine_lock:
+        if _engine is None or _engine.stat != _stat(STATE_PATH):
+            _engine = FeatureEngine.load()
+        return _engine
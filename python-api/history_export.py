@@ -0,0 +1,331 @@
+import argparse
+import base64
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+import prediction_history
+
+# Bulk export of prediction history and job records as CSV, NDJSON or Parquet (needs pyarrow).
+# Rows are read from a server-side cursor FETCH_ROWS at a time and encoded into chunks of
+# about CHUNK_BYTES, so memory stays flat whatever the date range. Rows come in key order,
+# (date, ticker) for predictions and (created_at, id) for jobs. A cursor is the key of the
+# last row received, an export cut off by limit (or a dropped connection) resumes after it.
+# A page with a limit is streamed as the key range up to its limit-th row, found first, and
+# that key is the next cursor, so a day republished in between cannot make the rows sent and
+# the cursor disagree. limit is capped at EXPORT_MAX_LIMIT.
+#
+#   python history_export.py predictions --start 2026-01-01 -o history.csv
+#   python history_export.py jobs --format ndjson -o jobs.ndjson --resume
+
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join(os.path.dirname(__file__), '../data/users.db'))
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_MAX_LIMIT = int(os.environ.get("EXPORT_MAX_LIMIT", "100000"))
+CHUNK_BYTES = 64 * 1024
+ROW_GROUP_ROWS = 10000
+JOB_COLUMNS = ("id", "user_id", "search_text", "status", "position", "worker_id", "progress", "result",
+               "created_at", "completed_at", "error_message")
+
+
+def job_rows(db_path, start=None, end=None, after=None, user_id=None, limit=None, offset=0, until=None):
+    """Yields job rows in (created_at, id) order, start and end are inclusive ISO dates, after
+    is the (created_at, id) of the last row already received and until that of the last row to send"""
+    if not os.path.exists(db_path):
+        return
+    query = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE 1 = 1"
+    params = []
+    # created_at is an ISO timestamp, plain string comparison keeps the index usable
+    if start:
+        query += " AND created_at >= ?"
+        params.append(start)
+    if end:
+        query += " AND created_at < ?"
+        params.append((date.fromisoformat(end) + timedelta(days=1)).isoformat())
+    if after:
+        query += " AND (created_at, id) > (?, ?)"
+        params.extend(after)
+    if until:
+        query += " AND (created_at, id) <= (?, ?)"
+        params.extend(until)
+    if user_id is not None:
+        query += " AND user_id = ?"
+        params.append(str(user_id))
+    query += " ORDER BY created_at, id"
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params.extend((limit, offset))
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            batch = cursor.fetchmany(prediction_history.FETCH_ROWS)
+            if not batch:
+                break
+            yield from batch
+    finally:
+        conn.close()
+
+
+# columns, key column indexes, JSON text columns, Parquet types by column
+DATASETS = {
+    "predictions": (prediction_history.COLUMNS, (1, 2), (),
+                    {"prediction": "float64", "rank": "int64", "percentile": "float64", "zscore": "float64",
+                     "change": "float64"}),
+    "jobs": (JOB_COLUMNS, (8, 0), ("result",), {"position": "int64", "progress": "float64"}),
+}
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != 2 or not all(isinstance(part, str) for part in key):
+        raise ValueError("Invalid cursor")
+    return tuple(key)
+
+
+def _csv(columns, rows, header=True):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _ndjson(columns, rows, json_columns=()):
+    parse = [columns.index(column) for column in json_columns]
+    buffer = io.StringIO()
+    for row in rows:
+        if parse:
+            row = list(row)
+            for i in parse:
+                if row[i] is not None:
+                    row[i] = json.loads(row[i])
+        buffer.write(json.dumps(dict(zip(columns, row))))
+        buffer.write("\n")
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+class _Sink(io.RawIOBase):
+    # Collects what ParquetWriter writes until the generator hands it on
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet(columns, rows, types):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(column, getattr(pa, types.get(column, "string"))()) for column in columns])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    batch = []
+
+    def write_group():
+        values = list(zip(*batch))
+        writer.write_table(pa.table([pa.array(values[i], schema.field(i).type) for i in range(len(columns))],
+                                    schema=schema))
+        batch.clear()
+
+    # One row group per ROW_GROUP_ROWS rows, sent as soon as it is written
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= ROW_GROUP_ROWS:
+            write_group()
+            yield sink.drain()
+    if batch:
+        write_group()
+    writer.close()
+    yield sink.drain()
+
+
+def stream(dataset, fmt="csv", start=None, end=None, cursor=None, limit=None, header=True, **filters):
+    """Validates the query and returns (chunks, next_cursor). chunks is a generator of bytes,
+    next_cursor is set when limit (capped at EXPORT_MAX_LIMIT) cut the export short. Raises ValueError on a bad query and
+    ImportError for parquet without pyarrow."""
+    columns, key, json_columns, types = DATASETS[dataset]
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of {', '.join(FORMATS)}")
+    if fmt == "parquet":
+        import pyarrow.parquet  # noqa: F401
+    for day in (start, end):
+        if day is not None:
+            date.fromisoformat(day)
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be positive")
+
+    after = decode_cursor(cursor) if cursor else None
+    if dataset == "predictions":
+        query = lambda **page: prediction_history.rows(filters.get("universe", "tickers_test.txt"), start, end, after, **page)
+    else:
+        query = lambda **page: job_rows(filters.get("db_path", JOBS_DB_PATH), start, end, after,
+                                        filters.get("user_id"), **page)
+
+    next_cursor = None
+    until = None
+    if limit is not None:
+        limit = min(limit, EXPORT_MAX_LIMIT)
+        # The limit-th row ends the page if any row follows it. The page is then streamed as
+        # the key range up to it (not LIMIT), so it ends exactly where the cursor continues.
+        page_end = list(query(limit=2, offset=limit - 1))
+        if len(page_end) == 2:
+            until = tuple(page_end[0][i] for i in key)
+            next_cursor = encode_cursor(until)
+    rows = query(until=until)
+    if fmt == "csv":
+        chunks = _csv(columns, rows, header)
+    elif fmt == "ndjson":
+        chunks = _ndjson(columns, rows, json_columns)
+    else:
+        chunks = _parquet(columns, rows, types)
+    return chunks, next_cursor
+
+
+def _csv_tail(f, columns):
+    """Offset after the last complete csv record and that record (None for just the header)"""
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    # csv.reader only counts lines, the line end offsets map a record back to bytes
+    ends = [0]
+    terminated = []
+
+    def lines():
+        for line in f:
+            ends.append(ends[-1] + len(line))
+            terminated.append(line.endswith(b"\n"))
+            yield line.decode("utf-8", errors="replace")
+
+    end, last, header = 0, None, True
+    # strict, so a quoted multi-line field cut off at the end raises instead of ending the row
+    reader = csv.reader(lines(), strict=True)
+    try:
+        for row in reader:
+            # A partial row ends the export, everything from its first line on is dropped
+            if len(row) != len(columns) or not terminated[reader.line_num - 1]:
+                break
+            end = ends[reader.line_num]
+            if header:
+                header = False
+            else:
+                last = row
+    except csv.Error:
+        pass
+    return min(end, size), last
+
+
+def _ndjson_tail(f, columns):
+    """Offset after the last complete ndjson line and that record (None if there is none)"""
+    # Newlines inside values are escaped, so every line is one record
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    while end > 0:
+        f.seek(max(end - CHUNK_BYTES, 0))
+        block = f.read(end - max(end - CHUNK_BYTES, 0))
+        newline = block.rfind(b"\n")
+        if newline >= 0:
+            end = max(end - CHUNK_BYTES, 0) + newline + 1
+            break
+        end = max(end - CHUNK_BYTES, 0)
+
+    f.seek(0)
+    last = None
+    position = 0
+    for line in f:
+        position += len(line)
+        if position > end:
+            break
+        if line.strip():
+            last = line
+    if last is not None:
+        record = json.loads(last)
+        last = [record[column] for column in columns]
+    return end, last
+
+
+def _resume_cursor(path, dataset, fmt):
+    """Cursor after the last complete row of an earlier csv/ndjson export, None if it has no rows.
+    A cut-off export may end in a partial row, the file is truncated to the last complete one."""
+    columns, key, _, _ = DATASETS[dataset]
+    with open(path, "r+b") as f:
+        end, last = (_csv_tail if fmt == "csv" else _ndjson_tail)(f, columns)
+        f.truncate(end)
+    return encode_cursor(tuple(last[i] for i in key)) if last else None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export prediction history or job records")
+    parser.add_argument("dataset", choices=list(DATASETS))
+    parser.add_argument("--format", choices=list(FORMATS), default="csv")
+    parser.add_argument("--start", help="First day, YYYY-MM-DD")
+    parser.add_argument("--end", help="Last day, YYYY-MM-DD")
+    parser.add_argument("--universe", default="tickers_test.txt")
+    parser.add_argument("--user-id", help="Only this user's jobs")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--after", help="Cursor to continue from")
+    parser.add_argument("--resume", action="store_true", help="Append to --output after its last row")
+    parser.add_argument("-o", "--output", help="Defaults to stdout")
+    args = parser.parse_args()
+
+    cursor, header = args.after, True
+    if args.resume:
+        if not args.output or args.format == "parquet":
+            parser.error("--resume needs a csv or ndjson --output")
+        if os.path.exists(args.output) and os.path.getsize(args.output):
+            cursor = _resume_cursor(args.output, args.dataset, args.format) or cursor
+            header = os.path.getsize(args.output) == 0
+
+    filters = {"universe": args.universe} if args.dataset == "predictions" else {"user_id": args.user_id}
+    try:
+        chunks, next_cursor = stream(args.dataset, args.format, args.start, args.end, cursor, args.limit,
+                                     header=header, **filters)
+    except (ValueError, ImportError) as e:
+        parser.error(str(e))
+
+    out = open(args.output, "ab" if args.resume else "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    if next_cursor:
+        print(f"More rows follow, continue with --after {next_cursor}", file=sys.stderr)
@@ -1,6 +1,8 @@
 
 import sys
 import os
+import threading
+import logging
 
 # Add the DayInference folder to the Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -11,12 +13,28 @@ from model import MyModule3
 import torch
 import numpy as np
 
+logger = logging.getLogger(__name__)
 
+WINDOW = 55
+CHECKPOINT_PATH = os.path.join(current_dir, "DayInference", "m5_220000.pth")
 
-model = MyModule3()
+def load_model(checkpoint_path=CHECKPOINT_PATH):
+    _model = MyModule3()
+    _model.load_state_dict(torch.load(checkpoint_path, map_location=torch.device('cpu')))
+    _model.eval()
+    return _model
 
-model.load_state_dict(torch.load(f"DayInference/m5_220000.pth", map_location=torch.device('cpu')))
-model.eval()
+# Loaded on first use, so importing this module does not read the checkpoint
+model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                model = load_model()
+    return model
 
 def infer(input_vector): # Takes in the last 55 opening prices (np.array) and outputs a 0 to 1 value
     try:
@@ -24,7 +42,6 @@ def infer(input_vector): # Takes in the last 55 opening prices (np.array) and ou
         #  Risk 14% (benchamrk is 6%)
         #  Expected return 1.5% (benchmark is 0.0005%)
 
-        print("Analysing input vector", input_vector)
         # pct_change of np vector
         _in = np.array(input_vector) + 0.000000000001
         _in = (_in[1:] - _in[:-1]) / _in[:-1]
@@ -33,12 +50,26 @@ def infer(input_vector): # Takes in the last 55 opening prices (np.array) and ou
         #print(_in)
 
         # Move to tensor
-        out = model(torch.tensor(_in, dtype=torch.float32))
+        out = get_model()(torch.tensor(_in, dtype=torch.float32))
         return torch.sigmoid(out[0]).item()
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error(f"Error: {e}")
         return None
 
+def prepare_batch(windows): # Same pct_change as infer(), for an (N, 55) matrix of opening prices
+    _in = np.asarray(windows, dtype=np.float64) + 0.000000000001
+    out = np.zeros(_in.shape, dtype=np.float32)
+    out[:, 1:] = (_in[:, 1:] - _in[:, :-1]) / _in[:, :-1]
+    return out
+
+def infer_batch(windows, batch_model=None): # Scores all windows in one forward pass, returns (N,) float32
+    batch_model = batch_model or get_model()
+    if len(windows) == 0:
+        return np.empty(0, dtype=np.float32)
+    with torch.no_grad():
+        out = batch_model(torch.from_numpy(prepare_batch(windows)))
+    return torch.sigmoid(out[:, 0]).numpy()
+
 
 if __name__ == "__main__":
     print(infer(list(range(55))))
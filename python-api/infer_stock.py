@@ -1,17 +1,26 @@
-import yfinance as yf
 import os
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
-import infer
+import shared_infer
+import feature_engine
+import model_registry
+import cancellation
+import profiling
 import numpy as np
-import requests
-from datetime import datetime, timedelta
 from avanza_get import get_prices_from_tickers
 import logging
 
 logger = logging.getLogger(__name__)
 
-def infer_stocks(stocks):
+def score_inputs(inputs, ensemble=None):
+    """Ensemble mean for (N, 55) model inputs from the feature engine, large universes go to
+    the shared memory worker pool"""
+    ensemble = ensemble or model_registry.get_ensemble()
+    if len(inputs) >= shared_infer.SHARED_INFER_MIN_TICKERS:
+        return shared_infer.score_shared(inputs, checkpoint_paths=ensemble.checkpoint_paths)
+    return ensemble.score_inputs(inputs).mean
+
+@profiling.profiled("infer_stocks")
+def infer_stocks(stocks, ensemble=None):
     _stocks = " ".join(stocks)
 
     print("Downloading data")
@@ -40,25 +49,38 @@ def infer_stocks(stocks):
     print("Data: ", data)
     data = data["Open"]"""
     data = get_prices_from_tickers(stocks)
+    cancellation.checkpoint()
 
-    preds = []
-    for args in data:
+    # Only new bars go into the rolling per-ticker state, the model inputs come out of it in one pass
+    engine = feature_engine.get_engine()
+    positions = {}
+    for idx, args in enumerate(data):
         try:
             if args is None:
                 raise ValueError("Received None instead of stock data")
             
-            ticker, opening_vals = args
-            ticker_data = opening_vals[-55:]
-            preds.append(infer.infer(ticker_data))
+            ticker, opening_vals, timestamps = args
+            engine.update(ticker, opening_vals, timestamps)
+            positions[ticker] = idx
         except Exception as e:
             logger.error(f"Error in infer_stocks: {str(e)}")
-            preds.append(None)
+    inputs, _, used = engine.features(list(positions))
+    for ticker in positions.keys() - set(used):
+        logger.error(f"Error in infer_stocks: not enough prices for {ticker}")
+    engine.save()
+    cancellation.checkpoint()
+
+    # Score the whole universe in one batch (all ensemble members at once)
+    scores = score_inputs(inputs, ensemble)
+    preds = [None] * len(data)
+    for ticker, score in zip(used, scores):
+        preds[positions[ticker]] = float(score)
 
     return preds
 
 
 if __name__ == "__main__":
-    with open("DayInference/nordic_tickers.txt", "r") as f:
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "DayInference/nordic_tickers.txt"), "r") as f:
         tickers = f.read().splitlines()
 
 
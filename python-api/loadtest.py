@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+# Load test for main.py: starts the API against a stubbed price provider in a scratch
+# directory, then drives a mix of HTTP requests and many concurrent WebSocket subscribers
+# with test JWTs, and reports throughput, latency percentiles, WebSocket message lag and
+# server RSS. Results can be saved as baselines and compared against later runs.
+#
+#   python loadtest.py --duration 30 --http-clients 50 --ws-clients 2000 --save before
+#   python loadtest.py --duration 30 --http-clients 50 --ws-clients 2000 --compare before
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(BASE_DIR, "loadtest_baselines")
+JWT_SECRET = os.environ.get("JWT_SECRET", "your-secret-key-change-in-production")
+
+# Relative weight of each HTTP request kind
+MIX = {"analyze": 4, "search": 4, "search_job": 1, "jobs": 2}
+QUERIES = ["a", "ab", "ap", "micro", "bank", "m", "t", "ge", "x", "zz"]
+
+
+def stub_prices(tickers_list):
+    """Deterministic synthetic opening prices per ticker, same shape as avanza_get.get_prices_from_tickers"""
+    latency = float(os.environ.get("STUB_LATENCY_MS", "0")) / 1000
+    day = 86400 * 1000
+    today = int(time.time() // 86400) * day
+    results = []
+    for ticker in tickers_list:
+        if latency:
+            time.sleep(latency)
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        prices = 100 * np.cumprod(1 + rng.normal(0, 0.02, 800))
+        timestamps = [today - (800 - i) * day for i in range(800)]
+        results.append((ticker, prices.tolist(), timestamps))
+    return results
+
+
+def serve(port, workdir):
+    """Runs main.app with all state in workdir and the stub price provider"""
+    os.environ.setdefault("PREWARM_ENABLED", "0")
+    os.environ["JOBS_DB_PATH"] = os.path.join(workdir, "users.db")
+    # The limits are part of what is measured, but the harness should not trip over them
+    os.environ.setdefault("SEARCH_RATE_PER_SECOND", "1000")
+    os.environ.setdefault("SEARCH_BURST", "1000")
+    os.environ.setdefault("MAX_JOBS_IN_FLIGHT_PER_USER", "1000")
+    sys.path.insert(0, BASE_DIR)
+
+    with sqlite3.connect(os.environ["JOBS_DB_PATH"]) as conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, user_id TEXT, search_text TEXT, status TEXT, position INTEGER,
+            worker_id TEXT, progress REAL, result TEXT, created_at TEXT, completed_at TEXT, error_message TEXT
+        )''')
+    shutil.copy(os.path.join(BASE_DIR, "tickers_test.txt"), workdir)
+
+    import uvicorn
+    import feature_engine
+    import infer_stock
+    import prediction_history
+    import ticker_analysis
+    import ticker_status
+    import websocket_hub
+    import main
+    ticker_analysis.BASE_DIR = workdir
+    ticker_status.STATUS_DB_PATH = os.path.join(workdir, "ticker_status.db")
+    prediction_history.HISTORY_DB_PATH = os.path.join(workdir, "prediction_history.db")
+    feature_engine.STATE_PATH = os.path.join(workdir, "feature_state.npz")
+    infer_stock.get_prices_from_tickers = stub_prices
+    # Per-request logs would cost more than the requests being measured
+    logging.getLogger().setLevel(logging.WARNING)
+
+    _raise_fd_limit()
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning", access_log=False,
+                **websocket_hub.SERVER_OPTIONS)
+
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, server, timeout=120):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            if time.time() > deadline or server.poll() is not None:
+                raise RuntimeError("Stub server did not start")
+            time.sleep(0.2)
+
+
+def _rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _token(user_id):
+    from jose import jwt
+    return jwt.encode({"id": user_id, "exp": time.time() + 3600}, JWT_SECRET, algorithm="HS256")
+
+
+def _percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3)}
+
+
+async def _http_client(client, token, stop_at, stats):
+    headers = {"Authorization": f"Bearer {token}"}
+    kinds, weights = zip(*MIX.items())
+    while time.perf_counter() < stop_at:
+        kind = random.choices(kinds, weights)[0]
+        start = time.perf_counter()
+        try:
+            if kind == "analyze":
+                response = await client.get("/data-api/analyze")
+            elif kind == "search":
+                response = await client.get("/data-api/search", params={"q": random.choice(QUERIES)}, headers=headers)
+            elif kind == "search_job":
+                response = await client.post("/data-api/search", json={"text": random.choice(QUERIES)}, headers=headers)
+            else:
+                response = await client.get("/data-api/jobs", headers=headers)
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        stats[kind]["latency_ms"].append((time.perf_counter() - start) * 1000)
+        stats[kind]["errors"] += 0 if ok else 1
+
+
+async def _ws_client(url, token, client_id, stop_at, stats):
+    import websockets
+    try:
+        async with websockets.connect(f"{url}/data-api/ws/{client_id}?token={token}", open_timeout=30,
+                                      ping_interval=None) as ws:
+            stats["connected"] += 1
+            while time.perf_counter() < stop_at:
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=max(stop_at - time.perf_counter(), 0.01))
+                except asyncio.TimeoutError:
+                    break
+                stats["messages"] += 1
+                data = json.loads(message)
+                if data.get("type") == "ping":
+                    await ws.send('{"type": "pong"}')
+                elif data.get("type") == "job_update" and data.get("timestamp"):
+                    # Server timestamps are local naive times on the same host
+                    lag = (datetime.now() - datetime.fromisoformat(data["timestamp"])).total_seconds() * 1000
+                    stats["lag_ms"].append(lag)
+    except Exception:
+        stats["failed"] += 1
+
+
+async def _sample_rss(pid, stop_at, samples):
+    while time.perf_counter() < stop_at:
+        rss = _rss_mb(pid)
+        if rss is not None:
+            samples.append(rss)
+        await asyncio.sleep(0.5)
+
+
+async def run_load(base_url, pid, duration, http_clients, ws_clients, ws_ramp):
+    import httpx
+    _raise_fd_limit()
+    ws_url = base_url.replace("http", "ws", 1)
+    http_stats = {kind: {"latency_ms": [], "errors": 0} for kind in MIX}
+    ws_stats = {"connected": 0, "failed": 0, "messages": 0, "lag_ms": []}
+    rss_samples = []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60,
+                                 limits=httpx.Limits(max_connections=http_clients)) as client:
+        # Warm the analysis once so the run measures the serving path
+        await client.get("/data-api/analyze")
+        rss_start = _rss_mb(pid) if pid else None
+
+        ws_stop = time.perf_counter() + duration + ws_clients / ws_ramp
+        tasks = [asyncio.create_task(_sample_rss(pid, ws_stop, rss_samples))] if pid else []
+        for i in range(ws_clients):
+            tasks.append(asyncio.create_task(_ws_client(ws_url, _token(i % 1000 + 1), f"load-{i}", ws_stop, ws_stats)))
+            if i % ws_ramp == ws_ramp - 1:
+                await asyncio.sleep(1)
+
+        start = time.perf_counter()
+        stop_at = start + duration
+        http_tasks = [asyncio.create_task(_http_client(client, _token(i + 1), stop_at, http_stats))
+                      for i in range(http_clients)]
+        await asyncio.gather(*http_tasks)
+        elapsed = time.perf_counter() - start
+        await asyncio.gather(*tasks)
+
+    report = {
+        "config": {"duration": duration, "http_clients": http_clients, "ws_clients": ws_clients},
+        "http": {},
+        "ws": {
+            "connected": ws_stats["connected"],
+            "failed": ws_stats["failed"],
+            "messages": ws_stats["messages"],
+            "lag_ms": _percentiles(ws_stats["lag_ms"]),
+        },
+        "rss_mb": {
+            "start": rss_start,
+            "peak": max(rss_samples) if rss_samples else None,
+            "end": _rss_mb(pid) if pid else None,
+        },
+    }
+    total = 0
+    for kind, stats in http_stats.items():
+        count = len(stats["latency_ms"])
+        total += count
+        report["http"][kind] = {"count": count, "rps": round(count / elapsed, 1), "errors": stats["errors"],
+                                "latency_ms": _percentiles(stats["latency_ms"])}
+    report["http"]["total_rps"] = round(total / elapsed, 1)
+    return report
+
+
+def print_report(report, baseline=None):
+    def delta(value, old):
+        if baseline is None or value is None or old is None:
+            return ""
+        return f" ({(value - old) / old * 100:+.0f}%)" if old else ""
+
+    print(f"{'endpoint':<12}{'count':>8}{'req/s':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind in MIX:
+        r = report["http"][kind]
+        old = baseline["http"][kind] if baseline else {"rps": None, "latency_ms": {}}
+        print(f"{kind:<12}{r['count']:>8}{r['rps']:>10}{r['errors']:>8}"
+              f"{str(r['latency_ms']['p50']):>10}{str(r['latency_ms']['p95']):>10}{str(r['latency_ms']['p99']):>10}"
+              f"{delta(r['rps'], old['rps'])}{delta(r['latency_ms']['p99'], old['latency_ms'].get('p99'))}")
+    print(f"total {report['http']['total_rps']} req/s"
+          f"{delta(report['http']['total_rps'], baseline['http']['total_rps'] if baseline else None)}")
+    ws = report["ws"]
+    print(f"websockets: {ws['connected']} connected, {ws['failed']} failed, {ws['messages']} messages, "
+          f"lag p50 {ws['lag_ms']['p50']} ms, p99 {ws['lag_ms']['p99']} ms")
+    rss = report["rss_mb"]
+    print(f"server rss: start {rss['start']} MB, peak {rss['peak']} MB, end {rss['end']} MB"
+          f"{delta(rss['peak'], baseline['rss_mb']['peak'] if baseline else None)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API with HTTP clients and WebSocket subscribers")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "serve"])
+    parser.add_argument("--url", help="Test an already running server instead of starting the stub one")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--workdir")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--http-clients", type=int, default=20)
+    parser.add_argument("--ws-clients", type=int, default=500)
+    parser.add_argument("--ws-ramp", type=int, default=500, help="WebSocket connections opened per second")
+    parser.add_argument("--save", help="Save the report as a named baseline")
+    parser.add_argument("--compare", help="Compare against a named baseline")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.port or 8000, args.workdir or tempfile.mkdtemp(prefix="loadtest-"))
+        sys.exit(0)
+
+    server = None
+    url = args.url
+    if url is None:
+        port = args.port or _free_port()
+        workdir = tempfile.mkdtemp(prefix="loadtest-")
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--port", str(port),
+                                   "--workdir", workdir])
+        url = f"http://127.0.0.1:{port}"
+        wait_for_port(port, server)
+
+    try:
+        report = asyncio.run(run_load(url, server.pid if server else None, args.duration,
+                                      args.http_clients, args.ws_clients, args.ws_ramp))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, f"{args.save}.json"), "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline saved to {os.path.join(BASELINE_DIR, args.save)}.json")
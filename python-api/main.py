@@ -1,10 +1,25 @@
-from fastapi import FastAPI, HTTPException, Depends, Security, status, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Depends, Security, status, WebSocket, WebSocketDisconnect, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
 import uvicorn
 import ticker_analysis
+import prewarm
+import admission
+import ranking_export
+import micro_batcher
+import ticker_search
+import model_manager
+import websocket_hub
+import cancellation
+import profiling
+import history_export
+import feature_engine
+from token_cache import TokenCache
 import logging
+import request_logging
+import time
 from datetime import datetime, timezone
 from uuid import uuid4
 import json
@@ -16,14 +31,11 @@ import threading
 from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 import math
-from jose import jwt, JWTError
+from jose import JWTError
 import asyncio
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+request_logging.configure(logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
@@ -50,27 +62,52 @@ ALGORITHM = "HS256"
 
 # Security
 security = HTTPBearer()
+token_cache = TokenCache(JWT_SECRET, [ALGORITHM])
+search_admission = admission.AdmissionController()
 
 class SearchRequest(BaseModel):
     # Accepts a payload with a "text" field (and optionally "client_id")
     query: str = Field(..., alias="text")
     client_id: Optional[str] = None
+    # Seconds from submission until the job times out, capped at JOB_TIMEOUT_SECONDS
+    timeout: Optional[float] = Field(None, gt=0)
+
+class ProfilingRequest(BaseModel):
+    # Profile the next `runs` calls of each target (all of profiling.TARGETS if omitted), 0 disarms
+    runs: int = Field(1, ge=0, le=100)
+    targets: Optional[List[str]] = None
+    memory: bool = False
+
+class ModelRequest(BaseModel):
+    # Checkpoint paths relative to python-api, served as one ensemble
+    checkpoints: List[str]
+
+class ScoreRequest(BaseModel):
+    # One or many windows of the last 55 opening prices, oldest first
+    windows: List[List[float]]
+
+MAX_SCORE_WINDOWS = 1000
+SEARCH_JOB_LIMIT = 50
 
 # Job management
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join(os.path.dirname(__file__), '../data/users.db'))
 jobs: Dict[str, 'SearchJob'] = {}
 job_queue = Queue()
 MAX_WORKERS = 4  # Reduced from 300 for better resource management
+JOB_TIMEOUT_SECONDS = float(os.environ.get("JOB_TIMEOUT_SECONDS", "300"))  # Deadline from submission, queue time included
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "timed_out"}
+CANCEL_POLL_SECONDS = 1.0  # How often cancel requests made through other workers are picked up
 executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 active_workers = 0
 worker_lock = threading.Lock()
 
 # WebSocket connections
-websocket_connections: Dict[str, List[WebSocket]] = {}
+ws_hub = websocket_hub.Hub()
 
 # WebSocket authentication
 async def authenticate_websocket(token: str):
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
+        payload = token_cache.decode(token)
         user_id = payload.get("id")
         if user_id is None:
             return None
@@ -82,7 +119,7 @@ async def authenticate_websocket(token: str):
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
+        payload = token_cache.decode(token)
         user_id = payload.get("id")
         if user_id is None:
             raise HTTPException(
@@ -98,6 +135,12 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+# Admin-only endpoints, is_admin is set in the token by the Node.js server
+async def get_admin_user(current_user: dict = Depends(get_current_user)):
+    if not current_user.get("is_admin"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return current_user
+
 @dataclass
 class JobStatus:
     id: str
@@ -108,20 +151,21 @@ class JobStatus:
     error_message: Optional[str] = None  # Added to track error messages
 
 class SearchJob:
-    def __init__(self, search_text: str, user_id: str):
-        self.id = str(uuid4())
+    def __init__(self, search_text: str, user_id: str, timeout: Optional[float] = None, job_id: Optional[str] = None):
+        self.id = job_id or str(uuid4())
         self.search_text = search_text
         self.user_id = user_id
         self.status = JobStatus(id=self.id, status="queued")
         self.result = None
         self.created_at = datetime.now(timezone.utc)
         self.completed_at = None
+        self.token = cancellation.CancelToken(min(timeout or JOB_TIMEOUT_SECONDS, JOB_TIMEOUT_SECONDS))
+        self._state_lock = threading.Lock()  # Guards the queued -> running -> terminal transitions
         self._save_to_db()
 
     def _save_to_db(self):
-        db_path = os.path.join(os.path.dirname(__file__), '../data/users.db')
         try:
-            with sqlite3.connect(db_path) as conn:
+            with sqlite3.connect(JOBS_DB_PATH) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                 INSERT OR REPLACE INTO jobs (
@@ -152,67 +196,131 @@ class SearchJob:
         
         # Send WebSocket update
         try:
-            await send_job_update(self)
+            send_job_update(self)
         except Exception as e:
             logger.error(f"Error sending WebSocket update: {str(e)}")
 
+    def finish(self, status, error_message=None):
+        """Moves the job to a terminal status (once) and frees its admission slot"""
+        with self._state_lock:
+            if self.status.status in TERMINAL_STATUSES:
+                return False
+            self.status.status = status
+            self.status.progress = 1.0 if status == "completed" else 0.0
+            self.status.error_message = error_message
+            self.completed_at = datetime.now(timezone.utc)
+            self._save_to_db()
+        search_admission.release(self.user_id)
+        send_job_update(self)
+        return True
+
+    def cancel(self):
+        """Cancels the job: a queued job ends right away, a running one at its next checkpoint"""
+        self.token.cancel()
+        with self._state_lock:
+            queued = self.status.status == "queued"
+        if queued:
+            self.finish("cancelled", "Job was cancelled")
+
+    @profiling.profiled("process_job")
     def process_job(self):
         """Process the job in a worker thread"""
         global active_workers
         try:
             with worker_lock:
                 active_workers += 1
+            with self._state_lock:
+                # Cancelled or expired while it waited in the queue
+                if self.status.status != "queued":
+                    return
+                self.token.check()
                 self.status.status = "running"
                 self.status.position = 0
                 self.status.worker_id = f"worker-{threading.get_ident()}"
                 self._save_to_db()
-                
-                # Send WebSocket update for job started
-                asyncio.run(send_job_update(self))
+
+            # Send WebSocket update for job started
+            send_job_update(self)
 
             # Update progress as the job runs
             self.status.progress = 0.5
             self._save_to_db()
             
             # Send WebSocket update for progress
-            asyncio.run(send_job_update(self))
-
-            # Process the job
-            tickers, predictions = ticker_analysis.get_latest_analysis()
-            
-            self.result = {
-                "tickers": tickers,
-                "predictions": [float(p) for p in predictions]
-            }
-            
-            self.status.status = "completed"
-            self.status.progress = 1.0
-            self.completed_at = datetime.now(timezone.utc)
-            self._save_to_db()
+            send_job_update(self)
+
+            # Process the job, a cancel or deadline ends the wait for the shared analysis refresh right away
+            with cancellation.bound(self.token):
+                snapshot = ticker_analysis.get_latest_snapshot()
+                self.token.check()
+            tickers, predictions = snapshot.tickers, snapshot.predictions.tolist()
+
+            if self.search_text.strip():
+                # Only the instruments matching the query, best match first
+                matches = ticker_search.get_index().search(self.search_text, limit=SEARCH_JOB_LIMIT)
+                self.result = {
+                    "tickers": [m["ticker"] for m in matches],
+                    "names": [m["name"] for m in matches],
+                    "predictions": [m["prediction"] for m in matches],
+                    **{f"{field}s": [m[field] for m in matches] for field in ("rank", "percentile", "zscore", "change")},
+                    **{field: [m[field] for m in matches] for field in feature_engine.FEATURES},
+                }
+            else:
+                self.result = {
+                    "tickers": tickers,
+                    "predictions": [float(p) for p in predictions],
+                    "ranks": snapshot.ranks.tolist(),
+                    **{field: [v if math.isfinite(v) else None for v in getattr(snapshot, field).tolist()]
+                       for field in ("percentiles", "zscores", "changes") + feature_engine.FEATURES}
+                }
+            self.result["model_version"] = snapshot.model_version
             
-            # Send WebSocket update for job completed
-            asyncio.run(send_job_update(self))
+            self.finish("completed")
 
+        except cancellation.Cancelled as e:
+            logger.info(f"Job {self.id} {e.status}: {str(e)}")
+            self.finish(e.status, str(e))
         except Exception as e:
             error_msg = str(e)
             logger.error(f"Job {self.id} failed: {error_msg}")
-            self.status.status = "failed"
-            self.status.error_message = error_msg
-            self.status.progress = 0.0
-            self._save_to_db()
-            
-            # Send WebSocket update for job failed
-            asyncio.run(send_job_update(self))
+            self.finish("failed", error_msg)
         finally:
             with worker_lock:
                 active_workers -= 1
 
+def _cancel_requested_jobs():
+    """Cancels this process' jobs that a cancel request reached through another worker"""
+    pending = [job_id for job_id, job in list(jobs.items()) if job.status.status not in TERMINAL_STATUSES]
+    if not pending:
+        return
+    with sqlite3.connect(JOBS_DB_PATH) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS job_cancellations (id TEXT PRIMARY KEY, requested_at TEXT)")
+        requested = [row[0] for row in conn.execute(
+            f"SELECT id FROM job_cancellations WHERE id IN ({', '.join('?' * len(pending))})", pending)]
+        conn.executemany("DELETE FROM job_cancellations WHERE id = ?", [(job_id,) for job_id in requested])
+    for job_id in requested:
+        logger.info(f"Job {job_id} cancelled through another worker")
+        jobs[job_id].cancel()
+
 def process_queue():
     """Background thread to process jobs from queue"""
+    last_cancel_poll = 0.0
     while True:
         try:
+            if time.monotonic() - last_cancel_poll >= CANCEL_POLL_SECONDS:
+                last_cancel_poll = time.monotonic()
+                _cancel_requested_jobs()
+
             # Get job with timeout to prevent busy waiting
             job = job_queue.get(timeout=1.0)
+
+            # Cancelled jobs are already finished, expired ones never take a worker
+            if job.status.status in TERMINAL_STATUSES:
+                continue
+            remaining = job.token.remaining()
+            if remaining is not None and remaining <= 0:
+                job.finish("timed_out", "Job deadline exceeded while queued")
+                continue
             
             # Check if we can process more jobs
             with worker_lock:
@@ -233,99 +341,295 @@ def process_queue():
             logger.error(f"Error in queue processor: {str(e)}")
             threading.Event().wait(1.0)  # Sleep on error to prevent tight loop
 
-# Start queue processor thread
-queue_processor = threading.Thread(target=process_queue, daemon=True)
-queue_processor.start()
+# Startup state: /health only says the process is alive, /ready says it can serve analysis
+readiness = {"ready": False, "phase": "starting", "error": None}
+
+def warm_up():
+    """Loads the model, symbol index and analysis snapshot off the request path"""
+    try:
+        readiness["phase"] = "loading model"
+        import model_registry
+        model_registry.get_ensemble()
+        readiness["phase"] = "loading symbol index"
+        import symbol_index
+        symbol_index.orderbook_id("")
+        if not symbol_index.names():
+            logger.warning("Symbol index has no company names, search will only match tickers")
+        readiness["phase"] = "loading analysis"
+        ticker_analysis.load_snapshot()
+        readiness["phase"] = "ready"
+        readiness["ready"] = True
+    except Exception as e:
+        logger.error(f"Warm-up failed: {str(e)}")
+        readiness["phase"] = "failed"
+        readiness["error"] = str(e)
+
+@app.on_event("startup")
+async def start_background_threads():
+    # Start queue processor thread
+    queue_processor = threading.Thread(target=process_queue, daemon=True)
+    queue_processor.start()
+
+    # Job updates from worker threads are handed to this loop
+    ws_hub.start(asyncio.get_running_loop())
+
+    # Refresh the analysis in the background when new daily bars are out
+    if os.environ.get("PREWARM_ENABLED", "1") == "1":
+        prewarm.start()
+
+    threading.Thread(target=warm_up, daemon=True, name="warm-up").start()
+
+    # Swap in new checkpoints without a restart
+    if os.environ.get("MODEL_WATCH_ENABLED", "1") == "1":
+        model_manager.start()
 
 @app.get("/data-api/health")
 async def health_check():
     return {"status": "ok", "timestamp": datetime.now().isoformat()}
 
+@app.get("/data-api/ready")
+async def readiness_check():
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail=readiness["phase"])
+    return {"status": "ready", "timestamp": datetime.now().isoformat()}
+
 @app.get("/data-api/analyze")
-async def analyze():
+async def analyze(request: Request):
     try:
-        tickers, predictions = ticker_analysis.get_latest_analysis()
-        
-        # Create a list of zipped tickers and predictions
-        zipped = list(zip(tickers, predictions))
-
-        # Sort tickers and predictions while handling non-finite values:
-        sorted_zipped = sorted(zipped, key=lambda x: x[1] if math.isfinite(x[1]) else -float('inf'), reverse=True)
-
-        if sorted_zipped:
-            tickers, predictions = zip(*sorted_zipped)
-        else:
-            tickers, predictions = [], []
-
-        # Replace non-finite predictions with None so that JSON encoding works smoothly
-        safe_predictions = [p if math.isfinite(p) else None for p in predictions]
-
-        print(tickers[:3], safe_predictions[:3])
-        return {"tickers": tickers, "predictions": safe_predictions}
+        # Bulk consumers can ask for the whole ranking as one binary buffer
+        media_type = ranking_export.negotiate(request.headers.get("accept"))
+        if media_type is not None:
+            snapshot = await asyncio.to_thread(ticker_analysis.get_latest_snapshot)
+            try:
+                body = ranking_export.export(snapshot, media_type)
+            except ImportError:
+                raise HTTPException(status_code=406, detail=f"{media_type} is not available on this server")
+            return Response(content=body, media_type=media_type,
+                            headers={"X-Snapshot-Date": snapshot.date.isoformat(), "X-Count": str(len(snapshot)),
+                                     "X-Model-Version": snapshot.model_version or ""})
+
+        # Sorted ranking with rank, percentile, z-score and day-over-day change per ticker,
+        # all computed when the snapshot was published and encoded once per snapshot.
+        # A refresh, or waiting for another worker's, blocks, so it runs off the event loop
+        snapshot = await asyncio.to_thread(ticker_analysis.get_latest_snapshot)
+        return Response(content=ranking_export.export(snapshot, ranking_export.JSON), media_type="application/json")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in analyze: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/data-api/score")
+async def score(request: ScoreRequest, current_user: dict = Depends(get_current_user)):
+    if not 0 < len(request.windows) <= MAX_SCORE_WINDOWS:
+        raise HTTPException(status_code=422, detail=f"Send between 1 and {MAX_SCORE_WINDOWS} windows")
+    if any(len(window) != micro_batcher.WINDOW for window in request.windows):
+        raise HTTPException(status_code=422, detail=f"Every window needs {micro_batcher.WINDOW} prices")
+    try:
+        # Coalesced with concurrent requests into one forward pass on the inference thread
+        scores, dispersion, model_version = await asyncio.wrap_future(micro_batcher.get_batcher().submit(request.windows))
+        return {
+            "scores": [float(s) if math.isfinite(s) else None for s in scores],
+            "dispersion": [float(d) if math.isfinite(d) else None for d in dispersion],
+            "model_version": model_version,
+        }
+    except Exception as e:
+        logger.error(f"Error in score: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+JOB_FIELDS = ("id", "text", "status", "progress", "created_at", "user_id", "error_message")
+
+def _job_summary(job):
+    return {
+        "id": job.id,
+        "text": job.search_text,
+        "status": job.status.status,
+        "progress": job.status.progress,
+        "created_at": job.created_at.isoformat(),
+        "user_id": job.user_id,
+        "error_message": job.status.error_message
+    }
+
 @app.get("/data-api/jobs")
 async def get_jobs(current_user: dict = Depends(get_current_user)):
     try:
-        # Return all jobs
-        job_list = []
-        for job_id, job in jobs.items():
-            job_list.append({
-                "id": job.id,
-                "text": job.search_text,
-                "status": job.status.status,
-                "progress": job.status.progress,
-                "created_at": job.created_at.isoformat(),
-                "user_id": job.user_id,
-                "error_message": job.status.error_message
-            })
+        # Admins get every job, other users their own. The jobs table holds the jobs of all
+        # worker processes, the ones running here report their live progress.
+        user_id = None if current_user.get("is_admin") else current_user.get("id")
+        job_list = await asyncio.to_thread(_job_rows, user_id)
+        for row in job_list:
+            job = jobs.get(row["id"])
+            if job is not None:
+                row.update(_job_summary(job))
         return job_list
     except Exception as e:
         logger.error(f"Error in get_jobs: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _job_row(job_id):
+    """The job as stored in the jobs table, for jobs created by another worker process"""
+    with sqlite3.connect(JOBS_DB_PATH) as conn:
+        row = conn.execute(
+            "SELECT id, search_text, status, progress, created_at, user_id, error_message FROM jobs WHERE id = ?",
+            (job_id,)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(JOB_FIELDS, row))
+
+def _job_rows(user_id=None):
+    """Jobs from the jobs table in creation order, only user_id's if given"""
+    query = "SELECT id, search_text, status, progress, created_at, user_id, error_message FROM jobs"
+    params = ()
+    if user_id is not None:
+        query += " WHERE user_id = ?"
+        params = (str(user_id),)
+    with sqlite3.connect(JOBS_DB_PATH) as conn:
+        rows = conn.execute(query + " ORDER BY created_at, id", params).fetchall()
+    return [dict(zip(JOB_FIELDS, row)) for row in rows]
+
+def _request_cancel(job_id):
+    # The worker that owns the job polls this table, see _cancel_requested_jobs
+    with sqlite3.connect(JOBS_DB_PATH) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS job_cancellations (id TEXT PRIMARY KEY, requested_at TEXT)")
+        conn.execute("INSERT OR IGNORE INTO job_cancellations (id, requested_at) VALUES (?, ?)",
+                     (job_id, datetime.now(timezone.utc).isoformat()))
+
 @app.get("/data-api/jobs/{job_id}")
 async def get_job_status(job_id: str, current_user: dict = Depends(get_current_user)):
     try:
         if job_id not in jobs:
-            raise HTTPException(status_code=404, detail="Job not found")
-        
-        job = jobs[job_id]
+            # With several workers the job may live in another process
+            row = await asyncio.to_thread(_job_row, job_id)
+            if row is None:
+                raise HTTPException(status_code=404, detail="Job not found")
+            return row
         
         # Return job status
-        return {
-            "id": job.id,
-            "text": job.search_text,
-            "status": job.status.status,
-            "progress": job.status.progress,
-            "created_at": job.created_at.isoformat(),
-            "user_id": job.user_id,
-            "error_message": job.status.error_message
-        }
+        return _job_summary(jobs[job_id])
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error in get_job_status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/data-api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = jobs.get(job_id)
+    if job is None:
+        # Created by another worker process, which picks the request up from the jobs database
+        row = await asyncio.to_thread(_job_row, job_id)
+        if row is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if str(row["user_id"]) != str(current_user.get("id")) and not current_user.get("is_admin"):
+            raise HTTPException(status_code=403, detail="Not your job")
+        if row["status"] in TERMINAL_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Job already {row['status']}")
+        await asyncio.to_thread(_request_cancel, job_id)
+        return {"id": job_id, "status": row["status"]}
+    if str(job.user_id) != str(current_user.get("id")) and not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Not your job")
+    if job.status.status in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status.status}")
+    # finish() writes the job to SQLite
+    await asyncio.to_thread(job.cancel)
+    return {"id": job.id, "status": job.status.status}
+
+def _export_response(dataset, format, start, end, cursor, limit, **filters):
+    try:
+        chunks, next_cursor = history_export.stream(dataset, format, start, end, cursor, limit, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError:
+        raise HTTPException(status_code=406, detail=f"{format} is not available on this server")
+    headers = {"Content-Disposition": f'attachment; filename="{dataset}.{format}"'}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    # The endpoints are sync so the page-end query runs in the threadpool, the generator then
+    # reads the database in chunks from the threadpool as the client consumes it
+    return StreamingResponse(chunks, media_type=history_export.FORMATS[format], headers=headers)
+
+@app.get("/data-api/export/predictions")
+def export_predictions(format: str = "csv", start: Optional[str] = None, end: Optional[str] = None,
+                       cursor: Optional[str] = None, limit: Optional[int] = None,
+                       universe: str = "tickers_test.txt", current_user: dict = Depends(get_current_user)):
+    return _export_response("predictions", format, start, end, cursor, limit, universe=universe)
+
+@app.get("/data-api/export/jobs")
+def export_jobs(format: str = "csv", start: Optional[str] = None, end: Optional[str] = None,
+                cursor: Optional[str] = None, limit: Optional[int] = None,
+                current_user: dict = Depends(get_current_user)):
+    # Admins get every job, other users their own
+    user_id = None if current_user.get("is_admin") else current_user.get("id")
+    return _export_response("jobs", format, start, end, cursor, limit, db_path=JOBS_DB_PATH, user_id=user_id)
+
+@app.get("/data-api/admin/profiling")
+async def get_profiling(current_user: dict = Depends(get_admin_user)):
+    return {
+        "targets": sorted(profiling.TARGETS),
+        "armed": profiling.status(),
+        "profiles": profiling.list_profiles()
+    }
+
+@app.post("/data-api/admin/profiling")
+async def arm_profiling(request: ProfilingRequest, current_user: dict = Depends(get_admin_user)):
+    try:
+        armed = profiling.arm(request.runs, request.targets, request.memory)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info("profiling armed", extra={"armed": armed, "admin_id": current_user.get("id")})
+    return {"armed": armed}
+
+@app.get("/data-api/admin/profiling/{name}")
+async def download_profile(name: str, current_user: dict = Depends(get_admin_user)):
+    path = profiling.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+@app.get("/data-api/search")
+async def search_instruments(q: str, limit: int = 10, current_user: dict = Depends(get_current_user)):
+    """Typeahead over tickers and company names, answered from the in-memory index without a job"""
+    index = ticker_search.get_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="No analysis available yet, create a search job instead")
+    return {
+        "query": q,
+        "date": index.date.isoformat() if index.date else None,
+        "results": index.search(q, max(1, min(limit, SEARCH_JOB_LIMIT)))
+    }
+
 @app.post("/data-api/search")
 async def search(request: SearchRequest, current_user: dict = Depends(get_current_user)):
     try:
         # Create a new job
         job_id = str(uuid4())
         user_id = current_user.get("id")
-        
-        # Create and store the job
-        job = SearchJob(request.query, user_id)
-        job.id = job_id
-        jobs[job_id] = job
-        
-        # Start processing the job
-        job.process_job()
+
+        # Rate and in-flight limits per user, checked before anything is queued
+        try:
+            search_admission.acquire(user_id)
+        except admission.Rejected as e:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=str(e),
+                headers={"Retry-After": str(math.ceil(e.retry_after))},
+            )
+
+        try:
+            # Create and store the job
+            # Saved under job_id right away, so no stray queued row is left behind
+            job = SearchJob(request.query, user_id, request.timeout, job_id=job_id)
+            jobs[job_id] = job
+        except Exception:
+            search_admission.release(user_id)
+            raise
+
+        # Hand the job to the queue processor, the worker releases the admission slot
+        job_queue.put(job)
         
         return {"job_id": job_id}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in search: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -333,9 +637,13 @@ async def search(request: SearchRequest, current_user: dict = Depends(get_curren
 # Add logging middleware
 @app.middleware("http")
 async def log_requests(request, call_next):
-    logger.info(f"Incoming request: {request.method} {request.url}")
-    response = await call_next(request)
-    logger.info(f"Response status: {response.status_code}")
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        request_logging.log_request(logger, request, 500, start)
+        raise
+    request_logging.log_request(logger, request, response.status_code, start)
     return response
 
 @app.websocket("/data-api/ws/{client_id}")
@@ -355,41 +663,58 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
     # Accept the connection
     await websocket.accept()
     
-    # Store the connection
-    if client_id not in websocket_connections:
-        websocket_connections[client_id] = []
-    websocket_connections[client_id].append(websocket)
+    subscriber = ws_hub.add(websocket, client_id, user.get("id"))
     
     try:
         # Send initial message
-        await websocket.send_json({
+        ws_hub.send(subscriber, {
             "type": "connection_established",
             "client_id": client_id,
             "user_id": user.get("id"),
             "timestamp": datetime.now().isoformat()
         })
         
-        # Keep the connection alive
+        # Anything the client sends counts as a heartbeat, "ping" is answered with "pong"
         while True:
-            # Wait for messages (this keeps the connection open)
-            data = await websocket.receive_text()
-            # Process any incoming messages if needed
-            await websocket.send_json({
-                "type": "message_received",
-                "data": data,
-                "timestamp": datetime.now().isoformat()
-            })
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            subscriber.last_seen = time.monotonic()
+            data = message.get("text") or message.get("bytes") or ""
+            if len(data) > websocket_hub.WS_MAX_INBOUND_BYTES:
+                ws_hub.evict(subscriber, 1009, "Message too big")
+                break
+            if data == "ping":
+                ws_hub.send(subscriber, "pong")
     except WebSocketDisconnect:
-        # Remove the connection when disconnected
-        if client_id in websocket_connections:
-            websocket_connections[client_id].remove(websocket)
-            if not websocket_connections[client_id]:
-                del websocket_connections[client_id]
+        pass
+    except Exception:
+        logger.exception(f"WebSocket error for client {client_id}")
+    finally:
+        # Dropped on any disconnect or error, not only a clean WebSocketDisconnect
+        ws_hub.remove(subscriber)
+
+@app.get("/data-api/admin/model")
+async def get_model_status(current_user: dict = Depends(get_admin_user)):
+    return model_manager.get_manager().status()
+
+@app.post("/data-api/admin/model", status_code=202)
+async def set_model(request: ModelRequest, current_user: dict = Depends(get_admin_user)):
+    try:
+        checkpoints = model_manager.set_active(request.checkpoints)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info("model change requested", extra={"checkpoints": checkpoints, "admin_id": current_user.get("id")})
+    return model_manager.get_manager().status()
+
+@app.get("/data-api/admin/websockets")
+async def websocket_stats(current_user: dict = Depends(get_admin_user)):
+    return ws_hub.stats()
 
 # Function to send job updates to WebSocket clients
-async def send_job_update(job):
-    """Send job updates to connected WebSocket clients"""
-    update = {
+def send_job_update(job):
+    """Queues a job update for every connected client, safe to call from worker threads"""
+    ws_hub.publish_threadsafe({
         "type": "job_update",
         "job_id": job.id,
         "status": job.status.status,
@@ -397,20 +722,20 @@ async def send_job_update(job):
         "worker_id": job.status.worker_id,
         "search_text": job.search_text,
         "timestamp": datetime.now().isoformat()
-    }
-    
-    # Send to all connected clients
-    for client_id, connections in websocket_connections.items():
-        for connection in connections:
-            try:
-                await connection.send_json(update)
-            except Exception as e:
-                logger.error(f"Error sending WebSocket update: {str(e)}")
+    })
 
 if __name__ == "__main__":
-    uvicorn.run(
-        app, 
-        host="0.0.0.0",  # Changed from "127.0.0.1" to allow external connections
-        port=8000,
-        reload=True  # Enable auto-reload during development
-    ) 
\ No newline at end of file
+    # Several workers share one analysis snapshot, see analysis_snapshot.py
+    api_workers = int(os.environ.get("API_WORKERS", "1"))
+    if api_workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=api_workers, access_log=False,
+                    **websocket_hub.SERVER_OPTIONS)
+    else:
+        uvicorn.run(
+            app, 
+            host="0.0.0.0",  # Changed from "127.0.0.1" to allow external connections
+            port=8000,
+            reload=True,  # Enable auto-reload during development
+            access_log=False,  # Requests are logged by log_requests
+            **websocket_hub.SERVER_OPTIONS
+        ) 
\ No newline at end of file
@@ -0,0 +1,126 @@
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+# Trading days and hours per exchange, enough to know when a new daily bar exists.
+# Early closes are ignored, a half day just gets its bar a few hours late.
+
+BAR_DELAY = timedelta(minutes=30)  # Time after the close until the chart API has the day's bar
+
+
+def _easter(year):
+    # Anonymous Gregorian algorithm
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year, month, weekday, n):
+    first = date(year, month, 1)
+    offset = (weekday - first.weekday()) % 7
+    return first + timedelta(days=offset + 7 * (n - 1))
+
+
+def _last_weekday(year, month, weekday):
+    last = date(year, month + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(d):
+    if d.weekday() == 5:
+        return d - timedelta(days=1)
+    if d.weekday() == 6:
+        return d + timedelta(days=1)
+    return d
+
+
+@lru_cache(maxsize=None)
+def nyse_holidays(year):
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),   # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),   # Presidents' Day
+        _easter(year) - timedelta(days=2),  # Good Friday
+        _last_weekday(year, 5, 0),     # Memorial Day
+        _observed(date(year, 7, 4)),
+        _nth_weekday(year, 9, 0, 1),   # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        _observed(date(year, 12, 25)),
+    }
+    # New Year's Day falling on a Saturday is not observed on the Friday before
+    if date(year, 1, 1).weekday() != 5:
+        holidays.add(_observed(date(year, 1, 1)))
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))
+    return frozenset(holidays)
+
+
+@lru_cache(maxsize=None)
+def xsto_holidays(year):
+    easter = _easter(year)
+    return frozenset({
+        date(year, 1, 1),
+        date(year, 1, 6),
+        easter - timedelta(days=2),    # Good Friday
+        easter + timedelta(days=1),    # Easter Monday
+        date(year, 5, 1),
+        easter + timedelta(days=39),   # Ascension Day
+        date(year, 6, 6),
+        date(year, 6, 19) + timedelta(days=(4 - date(year, 6, 19).weekday()) % 7),  # Midsummer Eve
+        date(year, 12, 24),
+        date(year, 12, 25),
+        date(year, 12, 26),
+        date(year, 12, 31),
+    })
+
+
+class MarketCalendar:
+    def __init__(self, name, tz, open_time, close_time, holidays):
+        self.name = name
+        self.tz = ZoneInfo(tz)
+        self.open_time = open_time
+        self.close_time = close_time
+        self.holidays = holidays
+
+    def is_trading_day(self, d):
+        return d.weekday() < 5 and d not in self.holidays(d.year)
+
+    def bar_available_at(self, d):
+        """Time at which the daily bar for trading day d can be downloaded"""
+        return datetime.combine(d, self.close_time, tzinfo=self.tz) + BAR_DELAY
+
+    def latest_bar_day(self, now=None):
+        """Most recent trading day whose bar is already available"""
+        now = (now or datetime.now(self.tz)).astimezone(self.tz)
+        d = now.date()
+        while not self.is_trading_day(d) or self.bar_available_at(d) > now:
+            d -= timedelta(days=1)
+        return d
+
+    def next_bar_time(self, now=None):
+        """When the next daily bar after latest_bar_day(now) becomes available"""
+        now = (now or datetime.now(self.tz)).astimezone(self.tz)
+        d = self.latest_bar_day(now) + timedelta(days=1)
+        while not self.is_trading_day(d):
+            d += timedelta(days=1)
+        return self.bar_available_at(d)
+
+
+NYSE = MarketCalendar("XNYS", "America/New_York", time(9, 30), time(16, 0), nyse_holidays)
+XSTO = MarketCalendar("XSTO", "Europe/Stockholm", time(9, 0), time(17, 30), xsto_holidays)
+
+UNIVERSE_CALENDARS = {
+    "tickers_test.txt": NYSE,
+    "DayInference/nordic_tickers.txt": XSTO,
+}
+
+
+def calendar_for(tickers_file_path):
+    return UNIVERSE_CALENDARS.get(tickers_file_path, NYSE)
@@ -0,0 +1,134 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+# Dynamic micro-batching for ad-hoc scoring: concurrent requests are queued and a dedicated
+# inference thread scores them together, waiting at most SCORE_MAX_WAIT_MS after the first
+# request (or until SCORE_MAX_BATCH windows) before running one forward pass.
+# A longer wait gives bigger batches and more throughput at the cost of latency.
+# Each batch is scored by the ensemble served when it starts, a model swap applies from the next batch.
+
+SCORE_MAX_BATCH = int(os.environ.get("SCORE_MAX_BATCH", "256"))
+SCORE_MAX_WAIT_MS = float(os.environ.get("SCORE_MAX_WAIT_MS", "2"))
+WINDOW = 55
+
+logger = logging.getLogger(__name__)
+
+
+def _score_with_ensemble(windows):
+    # Imported here so importing this module (and main) does not load torch
+    import model_registry
+    return model_registry.get_ensemble().score(windows)
+
+
+class MicroBatcher:
+    def __init__(self, max_batch=SCORE_MAX_BATCH, max_wait_ms=SCORE_MAX_WAIT_MS, score=None):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.score = score or _score_with_ensemble
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.rows = 0
+        self.thread = threading.Thread(target=self._run, daemon=True, name="micro-batcher")
+        self.thread.start()
+
+    def submit(self, windows):
+        """Queues an (n, 55) array of opening prices, the Future resolves to (scores, dispersion, model version)"""
+        future = Future()
+        self.requests.put((np.asarray(windows, dtype=np.float64).reshape(-1, WINDOW), future))
+        return future
+
+    def _collect(self):
+        # Requests whose future was cancelled while queued (client gone) are dropped,
+        # the rest are marked running so they can no longer be cancelled
+        batch = []
+        rows = 0
+        while not batch:
+            item = self.requests.get()
+            if item[1].set_running_or_notify_cancel():
+                batch.append(item)
+                rows = len(item[0])
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if item[1].set_running_or_notify_cancel():
+                batch.append(item)
+                rows += len(item[0])
+        return batch
+
+    @staticmethod
+    def _deliver(future, result=None, error=None):
+        # One bad future must not end the inference thread
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except Exception as e:
+            logger.error(f"Could not deliver a scoring result: {str(e)}")
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                result = self.score(np.concatenate([windows for windows, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    self._deliver(future, error=e)
+                continue
+            self.batches += 1
+            self.rows += len(result.mean)
+            start = 0
+            for windows, future in batch:
+                end = start + len(windows)
+                self._deliver(future, (result.mean[start:end], result.dispersion[start:end], result.version))
+                start = end
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher():
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher()
+        return _batcher
+
+
+if __name__ == "__main__":
+    # Benchmark: single-window requests/s and latency against the batch window
+    from concurrent.futures import ThreadPoolExecutor
+    import sys
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    per_client = 200
+    rng = np.random.default_rng(0)
+    window = 100 * np.cumprod(1 + rng.normal(0, 0.02, WINDOW))
+    import model_registry
+    model_registry.get_ensemble()
+
+    for max_wait_ms in (0, 0.5, 1, 2, 5, 10):
+        batcher = MicroBatcher(max_wait_ms=max_wait_ms)
+        latencies = []
+
+        def client():
+            for _ in range(per_client):
+                start = time.perf_counter()
+                batcher.submit(window).result()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(clients) as executor:
+            for _ in range(clients):
+                executor.submit(client)
+        elapsed = time.perf_counter() - start
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"wait {max_wait_ms:>4} ms: {len(latencies) / elapsed:>8,.0f} req/s, "
+              f"mean batch {batcher.rows / max(batcher.batches, 1):6.1f}, p50 {p50:6.2f} ms, p99 {p99:6.2f} ms")
@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+import analysis_snapshot
+import prewarm
+import ticker_analysis
+
+logger = logging.getLogger(__name__)
+
+# Hot-swaps the served ensemble without a restart. A new set of checkpoints (a changed
+# checkpoint file, or a new ACTIVE_MODEL_PATH written by set_active) is loaded on a
+# background thread, warmed with a synthetic batch, its stacked pass checked against each
+# checkpoint's own MyModule3 forward pass (member parity), and its scores on the same probe
+# batch compared with the serving model's (drift, a swap is refused above MODEL_MAX_DRIFT),
+# then swapped in with model_registry.swap. Batches already
+# running keep the ensemble they started with. Snapshots carry the model version, after
+# a swap they are re-scored from the feature engine's windows.
+# infer and model_registry (torch) are imported on first use, main imports this module.
+
+MODEL_WATCH_SECONDS = float(os.environ.get("MODEL_WATCH_SECONDS", "30"))
+PARITY_TOLERANCE = 1e-5
+# Mean absolute change of the sigmoid scores on the probe batch that a swap may cause, 1 disables the check
+MODEL_MAX_DRIFT = float(os.environ.get("MODEL_MAX_DRIFT", "0.2"))
+WARMUP_ROWS = 256
+
+
+def synthetic_batch(rows=WARMUP_ROWS, seed=0):
+    import infer
+    rng = np.random.default_rng(seed)
+    return 100 * np.cumprod(1 + rng.normal(0, 0.02, size=(rows, infer.WINDOW)), axis=1)
+
+
+def check_member_parity(ensemble, windows):
+    """Largest difference between the ensemble's stacked pass and each member checkpoint's own
+    MyModule3 forward pass, i.e. that the stacked weights score like the checkpoints they came
+    from. Says nothing about how the new model compares with the one it replaces."""
+    import infer
+    scores = ensemble.score(windows)
+    if not np.isfinite(scores.per_model).all():
+        raise ValueError("Model produced non-finite scores")
+    worst = 0.0
+    for member, path in enumerate(ensemble.checkpoint_paths):
+        reference = infer.infer_batch(windows, infer.load_model(path))
+        worst = max(worst, float(np.abs(scores.per_model[member] - reference).max()))
+    if worst > PARITY_TOLERANCE:
+        raise ValueError(f"Member parity check failed, max difference {worst:.2e}")
+    return worst
+
+
+def check_drift(candidate, current, windows):
+    """Mean absolute difference between the candidate's and the serving model's scores on the
+    probe batch, raises if it is above MODEL_MAX_DRIFT"""
+    drift = float(np.abs(candidate.score(windows).mean - current.score(windows).mean).mean())
+    if drift > MODEL_MAX_DRIFT:
+        raise ValueError(f"New model moves scores by {drift:.4f} on average, more than MODEL_MAX_DRIFT {MODEL_MAX_DRIFT}")
+    return drift
+
+
+def _fingerprint():
+    import model_registry
+    paths = model_registry.active_checkpoints()
+    entries = []
+    for path in [model_registry.ACTIVE_MODEL_PATH] + list(paths):
+        try:
+            st = os.stat(path)
+            entries.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            entries.append((path, None, None))
+    return tuple(entries)
+
+
+class ModelManager(threading.Thread):
+    def __init__(self, universes=None):
+        super().__init__(daemon=True, name="model-watch")
+        self.universes = universes or prewarm.PREWARM_UNIVERSES
+        self.lock = threading.Lock()
+        self.loader = None
+        self.state = {"status": "idle", "version": None, "previous_version": None, "checkpoints": None,
+                      "swapped_at": None, "member_parity": None, "drift": None, "error": None}
+        self.fingerprint = None
+        self.stop_event = threading.Event()
+
+    def run(self):
+        # Polls the checkpoint files and the active model manifest, a change triggers a load
+        if self.fingerprint is None:
+            self.fingerprint = _fingerprint()
+        while not self.stop_event.wait(MODEL_WATCH_SECONDS):
+            fingerprint = _fingerprint()
+            if fingerprint != self.fingerprint:
+                self.fingerprint = fingerprint
+                logger.info("Checkpoints changed, loading new model")
+                self.load()
+
+    def load(self, checkpoint_paths=None):
+        """Loads, warms and checks the checkpoints in the background, then swaps them in.
+        False if a load is already running."""
+        with self.lock:
+            if self.loader is not None and self.loader.is_alive():
+                return False
+            self.state["status"] = "loading"
+            self.loader = threading.Thread(target=self._load, args=(checkpoint_paths,), daemon=True, name="model-load")
+            self.loader.start()
+        return True
+
+    def _load(self, checkpoint_paths):
+        import infer
+        import model_registry
+        try:
+            candidate = model_registry.StackedEnsemble(checkpoint_paths or model_registry.active_checkpoints())
+            current = model_registry.get_ensemble()
+            if candidate.version == current.version:
+                self.state.update(status="idle", version=current.version, error=None)
+                return
+            windows = synthetic_batch()
+            # The first passes allocate, requests on the new model should not pay for that
+            for _ in range(3):
+                candidate.score(windows)
+            member_parity = check_member_parity(candidate, windows)
+            # New against old on the same probe batch, a broken or mismatched checkpoint is not swapped in
+            drift = check_drift(candidate, current, windows)
+            previous = model_registry.swap(candidate)
+            self.state.update(status="idle", version=candidate.version,
+                              previous_version=previous.version if previous is not None else None,
+                              checkpoints=[os.path.relpath(p, infer.current_dir) for p in candidate.checkpoint_paths],
+                              swapped_at=time.time(), member_parity=member_parity, drift=drift, error=None)
+            logger.info(f"Swapped model {current.version} -> {candidate.version} (mean score change {drift:.4f})")
+        except Exception as e:
+            logger.error(f"Model load failed: {str(e)}")
+            self.state.update(status="failed", error=str(e))
+            # Snapshots are not rescored to a model that is not served
+            model_registry.reject(model_registry.manifest_version())
+            return
+
+        # Cached analyses were scored by the old model
+        for universe in self.universes:
+            try:
+                ticker_analysis.rescore(universe)
+            except Exception as e:
+                logger.error(f"Rescoring {universe} failed: {str(e)}")
+
+    def status(self):
+        import model_registry
+        return dict(self.state, version=model_registry.active_version() or self.state["version"])
+
+
+def set_active(checkpoints):
+    """Makes checkpoints (paths relative to python-api) the served model for every worker process"""
+    import infer
+    import model_registry
+    paths = []
+    for checkpoint in checkpoints:
+        path = os.path.realpath(os.path.join(infer.current_dir, checkpoint))
+        if not path.startswith(infer.current_dir + os.sep) or not path.endswith(".pth") or not os.path.isfile(path):
+            raise ValueError(f"Not a checkpoint: {checkpoint}")
+        paths.append(os.path.relpath(path, infer.current_dir))
+    if not paths:
+        raise ValueError("No checkpoints given")
+    # Other workers pick the manifest up on their next poll
+    analysis_snapshot.write_atomic(model_registry.ACTIVE_MODEL_PATH, lambda f: json.dump({"checkpoints": paths}, f))
+    manager = get_manager()
+    manager.fingerprint = _fingerprint()
+    manager.load()
+    return paths
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ModelManager()
+        return _manager
+
+
+def start():
+    manager = get_manager()
+    if not manager.is_alive():
+        manager.start()
+    return manager
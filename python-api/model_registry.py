@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+import numpy as np
+import torch
+
+import infer
+
+# Ensemble of MyModule3 checkpoints scored in one batched pass: the members' weights are
+# stacked into (members, out, in) tensors, so every layer is a single bmm over all members
+# instead of one forward pass per checkpoint.
+# ENSEMBLE_CHECKPOINTS is a comma separated list of checkpoint paths (relative to this file).
+# ACTIVE_MODEL_PATH, when it exists, overrides it ({"checkpoints": [...]}), it is written
+# by model_manager.set_active so every worker process switches to the same checkpoints.
+
+ENSEMBLE_CHECKPOINTS = [
+    os.path.join(infer.current_dir, path.strip())
+    for path in os.environ.get("ENSEMBLE_CHECKPOINTS", "").split(",") if path.strip()
+] or [infer.CHECKPOINT_PATH]
+ACTIVE_MODEL_PATH = os.environ.get("ACTIVE_MODEL_PATH", os.path.join(infer.current_dir, "active_model.json"))
+
+
+@dataclass
+class EnsembleScores:
+    mean: np.ndarray        # (N,) mean sigmoid score over the members
+    dispersion: np.ndarray  # (N,) standard deviation over the members
+    per_model: np.ndarray   # (members, N)
+    version: str = None     # StackedEnsemble.version that produced the scores
+
+
+def _file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _dedupe(checkpoint_paths):
+    """Checkpoint paths with duplicate weights dropped, and the version they make up"""
+    # The same weights under two paths (e.g. copies of m5_220000.pth) count once
+    unique = {}
+    for path in checkpoint_paths:
+        unique.setdefault(_file_hash(path), path)
+    return list(unique.values()), hashlib.sha256("".join(unique).encode()).hexdigest()[:12]
+
+
+class StackedEnsemble:
+    def __init__(self, checkpoint_paths=None):
+        self.checkpoint_paths, self.version = _dedupe(checkpoint_paths or ENSEMBLE_CHECKPOINTS)
+
+        states = [torch.load(path, map_location=torch.device('cpu')) for path in self.checkpoint_paths]
+        stack = lambda key: torch.stack([state[key] for state in states]).float()
+        self.w1, self.b1 = stack("linear1.weight"), stack("linear1.bias")  # (M, 500, 55), (M, 500)
+        self.w3, self.b3 = stack("linear3.weight"), stack("linear3.bias")  # (M, 500, 500), (M, 500)
+        self.w4, self.b4 = stack("linear4.weight"), stack("linear4.bias")  # (M, 1, 500), (M, 1)
+
+    def __len__(self):
+        return len(self.checkpoint_paths)
+
+    def logits(self, inputs):
+        """(N, 55) model inputs -> (members, N) logits, same math as MyModule3.forward per member"""
+        x = inputs.unsqueeze(0).expand(len(self), -1, -1)
+        x = torch.relu(torch.baddbmm(self.b1.unsqueeze(1), x, self.w1.transpose(1, 2)))
+        x = torch.relu(torch.baddbmm(self.b3.unsqueeze(1), x, self.w3.transpose(1, 2)))
+        x = torch.baddbmm(self.b4.unsqueeze(1), x, self.w4.transpose(1, 2))
+        return x[:, :, 0]
+
+    def score(self, windows):
+        """Scores (N, 55) opening price windows with every member at once"""
+        return self.score_inputs(infer.prepare_batch(windows))
+
+    def score_inputs(self, inputs):
+        """Scores (N, 55) model inputs (pct changes, see infer.prepare_batch), e.g. from the feature engine"""
+        if len(inputs) == 0:
+            empty = np.empty(0, dtype=np.float32)
+            return EnsembleScores(empty, empty, np.empty((len(self), 0), dtype=np.float32), self.version)
+        with torch.no_grad():
+            per_model = torch.sigmoid(self.logits(torch.from_numpy(np.ascontiguousarray(inputs, dtype=np.float32))))
+        per_model = per_model.numpy()
+        return EnsembleScores(per_model.mean(axis=0), per_model.std(axis=0), per_model, self.version)
+
+
+def active_checkpoints():
+    """Checkpoints the process should serve: ACTIVE_MODEL_PATH if present, else ENSEMBLE_CHECKPOINTS"""
+    try:
+        with open(ACTIVE_MODEL_PATH) as f:
+            paths = json.load(f)["checkpoints"]
+    except FileNotFoundError:
+        return ENSEMBLE_CHECKPOINTS
+    return [os.path.join(infer.current_dir, path) for path in paths]
+
+
+_manifest = (None, None)  # (fingerprint of the active checkpoints, their version)
+_rejected = set()         # Manifest versions model_manager refused to swap in
+
+
+def reject(version):
+    """Keeps snapshots on the served model while the manifest names a model that failed its checks"""
+    _rejected.add(version)
+
+def manifest_version():
+    """Version of the active checkpoints on disk, the one every worker converges on. Computed
+    from the file hashes without loading weights, cached until a checkpoint or the manifest changes.
+    Falls back to the served version while the manifest or a checkpoint cannot be read, or
+    names a model that was rejected."""
+    global _manifest
+    try:
+        paths = active_checkpoints()
+        fingerprint = []
+        for path in paths:
+            st = os.stat(path)
+            fingerprint.append((path, st.st_mtime_ns, st.st_size))
+        if _manifest[0] != fingerprint:
+            _manifest = (fingerprint, _dedupe(paths)[1])
+    except (OSError, ValueError, KeyError, TypeError):
+        # A missing checkpoint or a broken manifest must not fail every staleness check,
+        # the model this process serves stays the reference until the manifest is fixed
+        return active_version()
+    return active_version() if _manifest[1] in _rejected else _manifest[1]
+
+
+_ensemble = None
+_ensemble_lock = threading.Lock()
+
+def get_ensemble():
+    """Process-wide ensemble of the active checkpoints, loaded on first use"""
+    global _ensemble
+    with _ensemble_lock:
+        if _ensemble is None:
+            _ensemble = StackedEnsemble(active_checkpoints())
+        return _ensemble
+
+
+def active_version():
+    """Version of the ensemble being served, None while none is loaded"""
+    ensemble = _ensemble
+    return ensemble.version if ensemble is not None else None
+
+
+def swap(ensemble):
+    """Serves ensemble from now on. Callers that already hold the old one finish with it."""
+    global _ensemble
+    with _ensemble_lock:
+        previous, _ensemble = _ensemble, ensemble
+    return previous
@@ -0,0 +1,85 @@
+import math
+import os
+import sqlite3
+
+# Every published snapshot is also appended here, one row per (universe, day, ticker), so
+# past days can be exported after the snapshot has been replaced. A republish of the same
+# day (repair, rescore) replaces that day's rows.
+
+HISTORY_DB_PATH = os.environ.get(
+    "HISTORY_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prediction_history.db"))
+COLUMNS = ("universe", "date", "ticker", "prediction", "model_version", "rank", "percentile", "zscore", "change")
+FETCH_ROWS = 1000
+
+
+def _connect(readonly=False):
+    if readonly:
+        # Streamed exports advance the cursor from whichever thread pulls the next chunk
+        return sqlite3.connect(f"file:{HISTORY_DB_PATH}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+    conn = sqlite3.connect(HISTORY_DB_PATH, timeout=30)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS predictions (
+        universe TEXT NOT NULL,
+        date TEXT NOT NULL,
+        ticker TEXT NOT NULL,
+        prediction REAL,
+        model_version TEXT,
+        rank INTEGER,
+        percentile REAL,
+        zscore REAL,
+        change REAL,
+        PRIMARY KEY (universe, date, ticker)
+    )
+    ''')
+    return conn
+
+
+def _nullable(values):
+    return [v if math.isfinite(v) else None for v in values.tolist()]
+
+
+def record(universe, snapshot):
+    """Stores snapshot as the universe's history for snapshot.date"""
+    day = snapshot.date.isoformat()
+    rows = zip([universe] * len(snapshot), [day] * len(snapshot), snapshot.tickers,
+               _nullable(snapshot.predictions), [snapshot.model_version] * len(snapshot), snapshot.ranks.tolist(),
+               _nullable(snapshot.percentiles), _nullable(snapshot.zscores), _nullable(snapshot.changes))
+    with _connect() as conn:
+        conn.execute("DELETE FROM predictions WHERE universe = ? AND date = ?", (universe, day))
+        conn.executemany(f"INSERT INTO predictions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+
+
+def rows(universe, start=None, end=None, after=None, limit=None, offset=0, until=None):
+    """Yields history rows in (date, ticker) order, start and end are inclusive ISO dates,
+    after is the (date, ticker) of the last row already received and until that of the last
+    row to send. Reads FETCH_ROWS at a time."""
+    if not os.path.exists(HISTORY_DB_PATH):
+        return
+    query = f"SELECT {', '.join(COLUMNS)} FROM predictions WHERE universe = ?"
+    params = [universe]
+    if start:
+        query += " AND date >= ?"
+        params.append(start)
+    if end:
+        query += " AND date <= ?"
+        params.append(end)
+    if after:
+        query += " AND (date, ticker) > (?, ?)"
+        params.extend(after)
+    if until:
+        query += " AND (date, ticker) <= (?, ?)"
+        params.extend(until)
+    query += " ORDER BY date, ticker"
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params.extend((limit, offset))
+    conn = _connect(readonly=True)
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            batch = cursor.fetchmany(FETCH_ROWS)
+            if not batch:
+                break
+            yield from batch
+    finally:
+        conn.close()
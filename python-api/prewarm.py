@@ -0,0 +1,70 @@
+import logging
+import os
+import threading
+import time
+
+import market_calendar
+import ticker_analysis
+
+logger = logging.getLogger(__name__)
+
+# Background refresh so user requests never pay for a cold analysis.
+# Each universe is refreshed shortly after its exchange publishes a new daily
+# bar, tickers that failed are retried with exponential backoff until the next bar.
+
+PREWARM_UNIVERSES = [u for u in os.environ.get("PREWARM_UNIVERSES", "tickers_test.txt").split(",") if u]
+RETRY_BASE_SECONDS = 300
+MAX_RETRIES = 5
+MAX_SLEEP_SECONDS = 60
+
+
+class Prewarmer(threading.Thread):
+    def __init__(self, universes=None):
+        super().__init__(daemon=True, name="prewarm")
+        self.universes = universes or PREWARM_UNIVERSES
+        self.next_run = {u: 0.0 for u in self.universes}
+        self.retries = {u: 0 for u in self.universes}
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            now = time.time()
+            for universe in self.universes:
+                if self.next_run[universe] <= now:
+                    self._run(universe)
+            wait = min(self.next_run.values()) - time.time()
+            self.stop_event.wait(min(max(wait, 1.0), MAX_SLEEP_SECONDS))
+
+    def _run(self, universe):
+        calendar = market_calendar.calendar_for(universe)
+        next_bar = calendar.next_bar_time().timestamp()
+        try:
+            snapshot = ticker_analysis.load_snapshot(universe)
+            if not ticker_analysis.is_fresh(snapshot, universe):
+                logger.info(f"Prewarming analysis for {universe} ({calendar.name})")
+                ticker_analysis.get_latest_analysis(universe)
+                self.retries[universe] = 0
+            elif self.retries[universe]:
+                logger.info(f"Retrying failed tickers for {universe}")
+                ticker_analysis.repair_analysis(universe)
+            missing = len(ticker_analysis.missing_tickers(universe))
+        except Exception as e:
+            logger.error(f"Prewarm of {universe} failed: {str(e)}")
+            missing = None
+
+        if missing == 0 or self.retries[universe] >= MAX_RETRIES:
+            self.retries[universe] = 0
+            self.next_run[universe] = next_bar
+        else:
+            delay = RETRY_BASE_SECONDS * 2 ** self.retries[universe]
+            self.retries[universe] += 1
+            self.next_run[universe] = min(time.time() + delay, next_bar)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def start(universes=None):
+    prewarmer = Prewarmer(universes)
+    prewarmer.start()
+    return prewarmer
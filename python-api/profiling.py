@@ -0,0 +1,182 @@
+import cProfile
+import functools
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+# On-demand profiling of the next N runs of selected functions. @profiled("name") wraps a
+# function; while nothing is armed a call costs one dict lookup. arm() enables it for
+# the next N calls per target: each call is run under cProfile (saved as a pstats .prof
+# file, open with `python -m pstats` or snakeviz) and, with memory=True, tracemalloc
+# snapshots are taken before and after (saved as .tracemalloc, load with
+# tracemalloc.Snapshot.load). Arming is per process, with several uvicorn workers each
+# worker has its own counters.
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))  # Oldest profiles are deleted beyond this
+TRACEMALLOC_FRAMES = 10
+
+# Every name passed to @profiled. The server's targets are declared here as well, because
+# infer_stock and avanza_get are imported lazily and would otherwise only register after
+# the first refresh.
+TARGETS = {"process_job", "get_latest_analysis", "download_prices", "infer_stocks"}
+_armed = {}       # target -> (runs left, memory)
+_lock = threading.Lock()
+_local = threading.local()
+_tracing = 0      # Memory profiles in progress, tracemalloc runs while > 0
+
+
+def arm(runs, targets=None, memory=False):
+    """Profiles the next `runs` calls of each target (all targets by default)"""
+    targets = list(targets or TARGETS)
+    unknown = set(targets) - TARGETS
+    if unknown:
+        raise ValueError(f"Unknown profiling targets: {', '.join(sorted(unknown))}")
+    with _lock:
+        for target in targets:
+            if runs > 0:
+                _armed[target] = (runs, memory)
+            else:
+                _armed.pop(target, None)
+    return status()
+
+
+def disarm():
+    with _lock:
+        _armed.clear()
+
+
+def status():
+    with _lock:
+        return {target: {"runs_left": runs, "memory": memory} for target, (runs, memory) in _armed.items()}
+
+
+def _take(target):
+    """Claims one profiled run for target, None if it is not armed"""
+    with _lock:
+        armed = _armed.get(target)
+        if armed is None:
+            return None
+        runs, memory = armed
+        if runs > 1:
+            _armed[target] = (runs - 1, memory)
+        else:
+            del _armed[target]
+        return memory
+
+
+def _start_tracing():
+    global _tracing
+    with _lock:
+        _tracing += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def _stop_tracing():
+    global _tracing
+    with _lock:
+        _tracing -= 1
+        if _tracing == 0:
+            tracemalloc.stop()
+
+
+def _prune():
+    # Files may be deleted concurrently (another worker pruning, an admin), skip those
+    files = []
+    for name in os.listdir(PROFILE_DIR):
+        path = os.path.join(PROFILE_DIR, name)
+        try:
+            files.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    files.sort()
+    for _, path in files[:max(len(files) - PROFILE_KEEP, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _run_profiled(target, memory, func, args, kwargs):
+    base = f"{target}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid4().hex[:6]}"
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if memory:
+        _start_tracing()
+        before = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    _local.active = True
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        _local.active = False
+        # Saving a profile must never replace the profiled function's result or exception
+        try:
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{base}.prof"))
+            if memory:
+                after = tracemalloc.take_snapshot()
+                before.dump(os.path.join(PROFILE_DIR, f"{base}-before.tracemalloc"))
+                after.dump(os.path.join(PROFILE_DIR, f"{base}-after.tracemalloc"))
+            _prune()
+        except Exception:
+            logger.exception(f"Saving the {target} profile failed")
+        finally:
+            if memory:
+                _stop_tracing()
+
+
+def profiled(target):
+    TARGETS.add(target)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Nested targets are already covered by the profile running in this thread
+            if not _armed or getattr(_local, "active", False):
+                return func(*args, **kwargs)
+            memory = _take(target)
+            if memory is None:
+                return func(*args, **kwargs)
+            return _run_profiled(target, memory, func, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        stat = os.stat(os.path.join(PROFILE_DIR, name))
+        profiles.append({"name": name, "size": stat.st_size, "created_at": stat.st_mtime})
+    return profiles
+
+
+def profile_path(name):
+    """Path of a stored profile, None for unknown names (or anything outside PROFILE_DIR)"""
+    if os.path.basename(name) != name or not name.endswith((".prof", ".tracemalloc")):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+if __name__ == "__main__":
+    # Overhead of the wrapper while disarmed
+    @profiled("noop")
+    def noop():
+        pass
+
+    def bare():
+        pass
+
+    n = 1000000
+    for name, func in (("bare", bare), ("profiled, disarmed", noop)):
+        start = time.perf_counter()
+        for _ in range(n):
+            func()
+        print(f"{name}: {(time.perf_counter() - start) / n * 1e9:.0f} ns/call")
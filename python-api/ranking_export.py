@@ -0,0 +1,112 @@
+import json
+import struct
+import threading
+import numpy as np
+
+from cross_section import ranking_order
+from feature_engine import FEATURES
+
+# Binary representations of the /data-api/analyze ranking for bulk consumers, built once
+# per snapshot and then served from memory.
+#
+# application/x-ranking (little endian):
+#   header "RANKING1", uint32 n, uint32 blob_len, int64 snapshot date ordinal
+#   float32  predictions[n]        sorted descending, NaN for non-finite / missing
+#   uint32   ticker_offsets[n + 1] into the blob
+#   bytes    blob                  utf-8 tickers, concatenated
+# Load with np.frombuffer at the offsets implied by the header.
+#
+# application/vnd.apache.arrow.stream: an Arrow IPC stream with a dictionary-encoded
+# ticker column, float32 prediction, uint32 rank and float32 percentile, zscore, change,
+# mean_return, volatility and momentum columns (needs pyarrow).
+#
+# application/json (the default): parallel "tickers", "predictions", "ranks",
+# "percentiles", "zscores", "changes", "mean_return", "volatility" and "momentum" lists
+# in ranking order, null for non-finite.
+
+BINARY = "application/x-ranking"
+ARROW = "application/vnd.apache.arrow.stream"
+JSON = "application/json"
+MEDIA_TYPES = (BINARY, ARROW)
+
+MAGIC = b"RANKING1"
+HEADER = struct.Struct("<8sIIq")
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def negotiate(accept):
+    """The binary media type asked for in an Accept header, or None for JSON"""
+    for part in (accept or "").split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type in MEDIA_TYPES:
+            return media_type
+    return None
+
+
+def _binary(snapshot):
+    order = ranking_order(snapshot.predictions)
+    predictions = snapshot.predictions[order]
+    names = [snapshot.tickers[i].encode("utf-8") for i in order]
+    offsets = np.zeros(len(names) + 1, dtype=np.uint32)
+    np.cumsum([len(name) for name in names], out=offsets[1:])
+    blob = b"".join(names)
+    return b"".join((
+        HEADER.pack(MAGIC, len(names), len(blob), snapshot.date.toordinal()),
+        predictions.astype("<f4").tobytes(),
+        offsets.astype("<u4").tobytes(),
+        blob,
+    ))
+
+
+def _arrow(snapshot):
+    import pyarrow as pa
+    order = ranking_order(snapshot.predictions)
+    predictions = snapshot.predictions[order]
+    table = pa.table({
+        "ticker": pa.array([snapshot.tickers[i] for i in order]).dictionary_encode(),
+        "prediction": pa.array(predictions, type=pa.float32(), mask=~np.isfinite(predictions)),
+        "rank": pa.array(snapshot.ranks[order]),
+        **{field: pa.array(getattr(snapshot, f"{field}s")[order], type=pa.float32(),
+                           mask=~np.isfinite(getattr(snapshot, f"{field}s")[order]))
+           for field in ("percentile", "zscore", "change")},
+        **{field: pa.array(getattr(snapshot, field)[order], type=pa.float32(),
+                           mask=~np.isfinite(getattr(snapshot, field)[order]))
+           for field in FEATURES},
+    }, metadata={"date": snapshot.date.isoformat(), "model_version": snapshot.model_version or ""})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _floats(values):
+    return [float(v) if np.isfinite(v) else None for v in values.tolist()]
+
+
+def _json(snapshot):
+    order = ranking_order(snapshot.predictions)
+    return json.dumps({
+        "tickers": [snapshot.tickers[i] for i in order],
+        "predictions": _floats(snapshot.predictions[order]),
+        "ranks": snapshot.ranks[order].tolist(),
+        "percentiles": _floats(snapshot.percentiles[order]),
+        "zscores": _floats(snapshot.zscores[order]),
+        "changes": _floats(snapshot.changes[order]),
+        **{field: _floats(getattr(snapshot, field)[order]) for field in FEATURES},
+        "date": snapshot.date.isoformat(),
+        "model_version": snapshot.model_version,
+    }).encode("utf-8")
+
+
+def export(snapshot, media_type):
+    """Encoded ranking for snapshot, computed on the first request for that snapshot only"""
+    with _cache_lock:
+        cached = _cache.get(media_type)
+        if cached is not None and cached[0] is snapshot:
+            return cached[1]
+    body = {ARROW: _arrow, JSON: _json}.get(media_type, _binary)(snapshot)
+    with _cache_lock:
+        _cache[media_type] = (snapshot, body)
+    return body
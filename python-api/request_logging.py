@@ -0,0 +1,99 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+
+# Logging off the request path: handlers only enqueue records, a QueueListener thread
+# formats them as JSON lines and writes them. Request logs are sampled per route.
+# LOG_SAMPLE_RATES="/data-api/health=0,/data-api/analyze=0.1" sets per-route rates (default 1).
+
+LOG_QUEUE_SIZE = 10000
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "1000"))
+STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _parse_rates(value):
+    rates = {}
+    for item in value.split(","):
+        if "=" in item:
+            route, rate = item.rsplit("=", 1)
+            rates[route.strip()] = float(rate)
+    return rates
+
+
+SAMPLE_RATES = _parse_rates(os.environ.get("LOG_SAMPLE_RATES", ""))
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        # Anything passed with extra= becomes a field
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Drops records instead of blocking or raising when the listener falls behind"""
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+_listener = None
+
+
+def configure(level=logging.INFO):
+    """Routes the root logger through a bounded queue to a background JSON writer"""
+    global _listener
+    if _listener is not None:
+        return _listener
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers = [DroppingQueueHandler(log_queue)]
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # Flush what is still queued on shutdown
+    return _listener
+
+
+def should_log(route, status_code, duration_ms):
+    # Errors and slow requests are always kept
+    if status_code >= 500 or duration_ms >= SLOW_REQUEST_MS:
+        return True
+    rate = SAMPLE_RATES.get(route, 1.0)
+    return rate >= 1.0 or random.random() < rate
+
+
+def log_request(logger, request, status_code, start):
+    duration_ms = (time.perf_counter() - start) * 1000
+    route = getattr(request.scope.get("route"), "path", request.url.path)
+    if not should_log(route, status_code, duration_ms):
+        return
+    logger.info("request", extra={
+        "method": request.method,
+        "route": route,
+        "path": request.url.path,
+        "status": status_code,
+        "duration_ms": round(duration_ms, 3),
+        "sample_rate": SAMPLE_RATES.get(route, 1.0),
+    })
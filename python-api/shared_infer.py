@@ -0,0 +1,155 @@
+import atexit
+import os
+import time
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+import infer
+import model_registry
+
+# Scores very large universes (50k+ tickers) with a pool of worker processes.
+# The (N, 55) model input matrix and the (N,) output live in shared memory, the
+# workers only receive (start, end) slices, so no arrays are pickled.
+
+SHARED_INFER_MIN_TICKERS = int(os.environ.get("SHARED_INFER_MIN_TICKERS", "5000"))
+SHARED_INFER_WORKERS = int(os.environ.get("SHARED_INFER_WORKERS", str(os.cpu_count() or 1)))
+CHUNK_SIZE = 2048
+
+# Worker process state, set once by _init_worker
+_model = None
+_segments = {}
+
+
+def _init_worker(checkpoint_paths, threads):
+    global _model
+    import torch
+    torch.set_num_threads(threads)
+    _model = model_registry.StackedEnsemble(checkpoint_paths)
+
+
+def _attach(*names):
+    # Drop segments from earlier (smaller) buffers before attaching the current ones
+    for name in list(_segments):
+        if name not in names:
+            _segments.pop(name).close()
+    for name in names:
+        if name not in _segments:
+            # Spawned workers share the parent's resource tracker, the parent unlinks the segments
+            _segments[name] = shared_memory.SharedMemory(name=name)
+    return [_segments[name] for name in names]
+
+
+def _score_slice(in_name, out_name, n, start, end):
+    in_shm, out_shm = _attach(in_name, out_name)
+    inputs = np.ndarray((n, infer.WINDOW), dtype=np.float32, buffer=in_shm.buf)
+    out = np.ndarray((n,), dtype=np.float32, buffer=out_shm.buf)
+    out[start:end] = _model.score_inputs(inputs[start:end]).mean
+    return end - start
+
+
+class SharedScorer:
+    def __init__(self, workers=None, checkpoint_paths=None, threads_per_worker=1):
+        self.workers = workers or SHARED_INFER_WORKERS
+        self.capacity = 0
+        self._in = None
+        self._out = None
+        self.checkpoint_paths = list(checkpoint_paths or model_registry.ENSEMBLE_CHECKPOINTS)
+        ctx = mp.get_context("spawn")
+        self.pool = ctx.Pool(self.workers, initializer=_init_worker, initargs=(self.checkpoint_paths, threads_per_worker))
+
+    def _ensure_capacity(self, n):
+        if n <= self.capacity:
+            return
+        self._release()
+        self.capacity = max(n, self.capacity * 2)
+        self._in = shared_memory.SharedMemory(create=True, size=self.capacity * infer.WINDOW * 4)
+        self._out = shared_memory.SharedMemory(create=True, size=self.capacity * 4)
+
+    def _release(self):
+        for shm in (self._in, self._out):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._in = self._out = None
+
+    def score(self, inputs):
+        """Scores an (N, 55) matrix of model inputs (pct changes, see infer.prepare_batch),
+        returns the (N,) float32 ensemble mean"""
+        inputs = np.asarray(inputs, dtype=np.float32)
+        n = len(inputs)
+        if n == 0:
+            return np.empty(0, dtype=np.float32)
+        self._ensure_capacity(n)
+        np.ndarray((n, infer.WINDOW), dtype=np.float32, buffer=self._in.buf)[:] = inputs
+
+        chunk = min(CHUNK_SIZE, -(-n // self.workers))
+        tasks = [(self._in.name, self._out.name, n, start, min(start + chunk, n)) for start in range(0, n, chunk)]
+        self.pool.starmap(_score_slice, tasks)
+
+        return np.ndarray((n,), dtype=np.float32, buffer=self._out.buf).copy()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+def score_shared(inputs, workers=None, checkpoint_paths=None):
+    """Scores with a process-wide SharedScorer, started on first use and restarted when the checkpoints change"""
+    global _scorer
+    checkpoint_paths = list(checkpoint_paths or model_registry.ENSEMBLE_CHECKPOINTS)
+    with _scorer_lock:
+        if _scorer is not None and _scorer.checkpoint_paths != checkpoint_paths:
+            _scorer.close()
+            _scorer = None
+        if _scorer is None:
+            _scorer = SharedScorer(workers, checkpoint_paths)
+        return _scorer.score(inputs)
+
+
+def shutdown():
+    """Closes the process-wide pool and waits for its workers to exit"""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is not None:
+            _scorer.close()
+            _scorer = None
+
+atexit.register(shutdown)
+
+
+if __name__ == "__main__":
+    # Benchmark: throughput against number of worker processes on a synthetic universe
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rng = np.random.default_rng(0)
+    windows = 100 * np.cumprod(1 + rng.normal(0, 0.02, size=(n, infer.WINDOW)), axis=1)
+    inputs = infer.prepare_batch(windows)
+
+    import torch
+    torch.set_num_threads(1)
+    start = time.time()
+    reference = model_registry.get_ensemble().score_inputs(inputs).mean
+    base = time.time() - start
+    print(f"in-process, 1 thread: {n / base:,.0f} tickers/s")
+
+    counts = sorted({1, 2, 4, 8, os.cpu_count() or 1})
+    for workers in [w for w in counts if w <= (os.cpu_count() or 1)]:
+        with SharedScorer(workers) as scorer:
+            scorer.score(inputs)  # warm up pool and buffers
+            start = time.time()
+            preds = scorer.score(inputs)
+            elapsed = time.time() - start
+        assert np.allclose(preds, reference, atol=1e-5)
+        print(f"{workers} workers: {n / elapsed:,.0f} tickers/s, speedup {base / elapsed:.2f}x")
@@ -0,0 +1,180 @@
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+# Versioned symbol index (ticker, ISIN, name, market -> Avanza orderbook id) in one SQLite file.
+# Built incrementally and in parallel from the orderbook JSON dumps (see yf_af_matching/match.py),
+# read lazily per market into dicts, so lookups are O(1) and importing this module parses nothing.
+
+SCHEMA_VERSION = 1
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "yf_af_matching", "symbols.db")
+DEFAULT_MARKET = "US"
+
+_by_ticker = {}
+_by_orderbook_id = {}
+_load_lock = threading.Lock()
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    CREATE TABLE IF NOT EXISTS symbols (
+        orderbook_id TEXT PRIMARY KEY,
+        ticker TEXT,
+        isin TEXT,
+        name TEXT,
+        market TEXT,
+        type TEXT
+    );
+    CREATE INDEX IF NOT EXISTS symbols_market_ticker ON symbols (market, ticker);
+    CREATE INDEX IF NOT EXISTS symbols_isin ON symbols (isin);
+    CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER);
+    ''')
+    return conn
+
+
+def _ticker_from_title(title):
+    # Same rules as the old match.py: "Name (TICKER)" or a bare ticker as title
+    ticker_match = re.search(r'\(([A-Z]+(?:[-.][A-Z])?)\)', title)
+    if ticker_match:
+        return ticker_match.group(1)
+    if re.match(r'^[A-Z]{1,7}$', title):
+        return title
+    return None
+
+
+def _parse_orderbook(path):
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        title = data.get('title') or ''
+        ticker = data.get('tickerSymbol') or _ticker_from_title(title)
+        order_book_id = os.path.basename(path).split('.')[0]
+        return (order_book_id, ticker, data.get('isin'), data.get('name') or title,
+                data.get('flagCode'), data.get('type'))
+    except Exception as e:
+        print(f"Error processing file {path}: {str(e)}")
+        return None
+
+
+def build_index(dump_dir, db_path=INDEX_PATH, workers=None):
+    """Adds new or changed orderbook dumps in dump_dir to the index and drops the rows of dumps
+    that were removed, returns the number of files parsed"""
+    conn = _connect(db_path)
+    known = {path: (mtime_ns, size) for path, mtime_ns, size in conn.execute("SELECT path, mtime_ns, size FROM files")}
+    changed = []
+    present = set()
+    # A missing dump directory is skipped, not taken as every dump removed
+    for path in glob.glob(os.path.join(dump_dir, "*.json")) if os.path.isdir(dump_dir) else []:
+        st = os.stat(path)
+        key = os.path.relpath(path, dump_dir)
+        present.add(key)
+        if known.get(key) != (st.st_mtime_ns, st.st_size):
+            changed.append((path, key, st))
+
+    if os.path.isdir(dump_dir):
+        removed = [key for key in known if key not in present]
+        conn.executemany("DELETE FROM symbols WHERE orderbook_id = ?",
+                         [(os.path.basename(key).split('.')[0],) for key in removed])
+        conn.executemany("DELETE FROM files WHERE path = ?", [(key,) for key in removed])
+
+    with ProcessPoolExecutor(workers) as executor:
+        rows = executor.map(_parse_orderbook, [path for path, _, _ in changed], chunksize=256)
+        for (path, key, st), row in zip(changed, rows):
+            # A dump that failed to parse is not recorded, so the next build tries it again
+            if row is None:
+                continue
+            conn.execute("INSERT OR REPLACE INTO symbols VALUES (?, ?, ?, ?, ?, ?)", row)
+            conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (key, st.st_mtime_ns, st.st_size))
+
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('built_at', ?)", (datetime.now(timezone.utc).isoformat(),))
+    conn.commit()
+    conn.close()
+    reset()
+    return len(changed)
+
+
+def import_mapping(mapping_path, market=DEFAULT_MARKET, db_path=INDEX_PATH):
+    """Seeds the index from an old ticker -> orderbook id JSON mapping"""
+    with open(mapping_path, 'r') as f:
+        mapping = json.load(f)
+    conn = _connect(db_path)
+    conn.executemany("INSERT OR IGNORE INTO symbols (orderbook_id, ticker, market, type) VALUES (?, ?, ?, 'STOCK')",
+                     [(str(order_book_id), ticker, market) for ticker, order_book_id in mapping.items()])
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('built_at', ?)", (datetime.now(timezone.utc).isoformat(),))
+    conn.commit()
+    conn.close()
+    reset()
+    return len(mapping)
+
+
+def import_reference(entries, market=DEFAULT_MARKET, db_path=INDEX_PATH):
+    """Fills in missing names and ISINs from (ticker, name, isin) entries, for rows seeded by
+    import_mapping rather than an orderbook dump. Values from dumps are kept. Returns rows updated."""
+    conn = _connect(db_path)
+    before = conn.total_changes
+    conn.executemany("UPDATE symbols SET name = COALESCE(name, ?), isin = COALESCE(isin, ?) "
+                     "WHERE market = ? AND ticker = ? AND (name IS NULL OR isin IS NULL)",
+                     [(name, isin, market, ticker) for ticker, name, isin in entries])
+    updated = conn.total_changes - before
+    conn.commit()
+    conn.close()
+    reset()
+    return updated
+
+
+def _load_market(market, db_path=INDEX_PATH):
+    with _load_lock:
+        if market in _by_ticker:
+            return
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            version = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+            if version is None or int(version[0]) != SCHEMA_VERSION:
+                raise RuntimeError(f"Symbol index {db_path} has schema {version}, expected {SCHEMA_VERSION}")
+            rows = conn.execute(
+                "SELECT ticker, orderbook_id FROM symbols WHERE market = ? AND type = 'STOCK' AND ticker IS NOT NULL "
+                "ORDER BY orderbook_id",
+                (market,)).fetchall()
+        finally:
+            conn.close()
+        _by_orderbook_id[market] = {orderbook_id: ticker for ticker, orderbook_id in rows}
+        _by_ticker[market] = {ticker: orderbook_id for ticker, orderbook_id in rows}
+
+
+def names(market=DEFAULT_MARKET, db_path=INDEX_PATH):
+    """{ticker: name} for the market's stocks, for search (read on demand, not cached)"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT ticker, name FROM symbols WHERE market = ? AND type = 'STOCK' "
+                            "AND ticker IS NOT NULL AND name IS NOT NULL", (market,)).fetchall()
+    finally:
+        conn.close()
+    return dict(rows)
+
+
+def orderbook_id(ticker, market=DEFAULT_MARKET):
+    if market not in _by_ticker:
+        _load_market(market)
+    return _by_ticker[market].get(ticker)
+
+
+def ticker(orderbook_id, market=DEFAULT_MARKET):
+    if market not in _by_orderbook_id:
+        _load_market(market)
+    return _by_orderbook_id[market].get(str(orderbook_id))
+
+
+def reset():
+    """Forgets the loaded markets, the next lookup re-reads the index"""
+    with _load_lock:
+        _by_ticker.clear()
+        _by_orderbook_id.clear()
@@ -1,83 +1,255 @@
-# Set the working directory to the directory of this file
-import os, time
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+import os, sys, threading, time
 
-import infer_stock as infer_stocks
-import pandas as pd
-from datetime import datetime
+import analysis_snapshot
+import cancellation
+import cross_section
+import profiling
+import market_calendar
+import prediction_history
+import ticker_status
 
-def get_latest_analysis(tickers_file_path="tickers_test.txt"):
-    start_time = time.time()
-    latest_analysis_file_path = tickers_file_path.replace(".txt", "_analysis.csv")
-    today = datetime.now().date()
-    file_date = None  # Default file_date when no analysis exists
-
-    tickers = []
-    preds = []
-    tail = None
-    
-    # Check if today is a weekend
-    if today.weekday() >= 5 and False:
-        with open(tickers_file_path, "r") as f:
-            tickers = [line.strip() for line in f if line.strip()]
-        print(f"Today is a weekend, skipping analysis for {today}")
-        return tickers, []*len(tickers)
+# Paths are relative to this file. pandas and the inference stack (torch, requests)
+# are imported on first refresh, so importing this module stays cheap.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _load_tickers(tickers_file_path):
+    with open(os.path.join(BASE_DIR, tickers_file_path), "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def _paths(tickers_file_path):
+    path = os.path.join(BASE_DIR, tickers_file_path)
+    return (path.replace(".txt", "_analysis.csv"),
+            path.replace(".txt", "_analysis.snap"),
+            path.replace(".txt", "_analysis.lock"))
+
+def _previous(snapshot_file_path, as_of):
+    # The snapshot being replaced is the base for the day-over-day change
+    return cross_section.previous_of(analysis_snapshot.load_snapshot(snapshot_file_path), as_of)
+
+def _ensemble():
+    """Ensemble of the manifest's checkpoints. A worker that has not picked up a swap yet still
+    publishes for the new model, so the workers never rescore the snapshot back and forth."""
+    import model_registry
+    ensemble = model_registry.get_ensemble()
+    if ensemble.version != model_registry.manifest_version():
+        ensemble = model_registry.StackedEnsemble(model_registry.active_checkpoints())
+    return ensemble
+
+def _write_snapshot(tickers_file_path, as_of, tickers, preds, model_version):
+    import feature_engine
+    snapshot_file_path = _paths(tickers_file_path)[1]
+    # Mean return, volatility and momentum straight from the engine's running sums
+    features = feature_engine.get_engine().rolling(tickers)
+    analysis_snapshot.write_snapshot(snapshot_file_path, as_of, tickers, preds, model_version,
+                                     _previous(snapshot_file_path, as_of), features)
+    # Kept per day for the history export, the snapshot only holds the latest one
+    prediction_history.record(tickers_file_path, analysis_snapshot.load_snapshot(snapshot_file_path))
 
+def _publish(tickers_file_path, as_of, tickers, preds, model_version):
+    import pandas as pd
+    latest_analysis_file_path = _paths(tickers_file_path)[0]
+    results_df = pd.DataFrame({
+        'Date': [as_of] * len(tickers),
+        'Ticker': tickers,
+        'Prediction': preds,
+        'Model': [model_version] * len(tickers),
+    })
+    # Filter out rows where Prediction is None
+    results_df = results_df.dropna(subset=['Prediction'])
+    analysis_snapshot.write_atomic(latest_analysis_file_path, lambda f: results_df.to_csv(f, index=False))
+    _write_snapshot(tickers_file_path, as_of, results_df["Ticker"].tolist(), results_df["Prediction"].tolist(), model_version)
+    #print(f"Analysis saved to {latest_analysis_file_path}")
+
+def _refresh(tickers_file_path, as_of):
+    """Runs inference for the as_of bar and publishes the csv and the snapshot, only called by the lease holder"""
+    import pandas as pd
+    import feature_engine
+    import infer_stock as infer_stocks
+    ensemble = _ensemble()
+    # Bars pushed by whichever worker refreshed last, also used for the features of a reused csv
+    feature_engine.reload()
+    latest_analysis_file_path = _paths(tickers_file_path)[0]
+    # Reuse the csv if another worker already wrote a fresh one with the same model
     if os.path.exists(latest_analysis_file_path):
-        #print(f"Loading analysis from {latest_analysis_file_path}")
-        df = pd.read_csv(latest_analysis_file_path)
-        if 'Date' in df.columns:
-            file_date = pd.to_datetime(df['Date'].iloc[0]).date()
-        if file_date == today:
-            #print(f"Using existing analysis from {today}")
-            tickers = df["Ticker"].tolist()
-            preds = df["Prediction"].tolist()
-            tail = df["Tail"].tolist() if "Tail" in df.columns else None
-        else:
-            # Load tickers from file for new analysis
-            with open(tickers_file_path, "r") as f:
-                tickers = [line.strip() for line in f if line.strip()]
+        df = pd.read_csv(latest_analysis_file_path, dtype={'Model': str})
+        if ('Date' in df.columns and 'Model' in df.columns and len(df)
+                and pd.to_datetime(df['Date'].iloc[0]).date() >= as_of and df['Model'].iloc[0] == ensemble.version):
+            _write_snapshot(tickers_file_path, as_of, df["Ticker"].tolist(), df["Prediction"].tolist(), ensemble.version)
+            return
+
+    # Instruments known to be unscorable (no mapping, too short history) are not downloaded again
+    skip = ticker_status.ineligible_tickers()
+    tickers = [ticker for ticker in _load_tickers(tickers_file_path) if ticker not in skip]
+    #print(f"Running new analysis for {as_of}")
+    preds = infer_stocks.infer_stocks(tickers, ensemble)
+    _publish(tickers_file_path, as_of, tickers, preds, ensemble.version)
+
+def _is_current(snapshot, as_of):
+    """Scored for as_of (or later) by the active model on disk, not the one this process
+    serves, which lags behind during a rollout"""
+    if snapshot is None or snapshot.date < as_of:
+        return False
+    # Without a loaded model (model_registry not even imported) any version will do
+    registry = sys.modules.get("model_registry")
+    return registry is None or snapshot.model_version == registry.manifest_version()
+
+def load_snapshot(tickers_file_path="tickers_test.txt"):
+    """Current memory-mapped snapshot for the universe (may be stale or None), never refreshes"""
+    return analysis_snapshot.load_snapshot(_paths(tickers_file_path)[1])
+
+def is_fresh(snapshot, tickers_file_path="tickers_test.txt"):
+    as_of = market_calendar.calendar_for(tickers_file_path).latest_bar_day()
+    return _is_current(snapshot, as_of)
+
+def missing_tickers(tickers_file_path="tickers_test.txt"):
+    """Tickers of the universe that have no prediction in the current snapshot and are worth retrying"""
+    snapshot = load_snapshot(tickers_file_path)
+    skip = set(snapshot.tickers) if snapshot is not None else set()
+    skip |= ticker_status.ineligible_tickers()
+    return [ticker for ticker in _load_tickers(tickers_file_path) if ticker not in skip]
+
+def repair_analysis(tickers_file_path="tickers_test.txt"):
+    """Re-scores only the tickers missing from the current snapshot and merges them in.
+    Returns how many are still missing, or None if another worker holds the lease."""
+    import feature_engine
+    import infer_stock as infer_stocks
+    _, _, lock_file_path = _paths(tickers_file_path)
+    with analysis_snapshot.refresh_lease(lock_file_path) as leader:
+        if not leader:
+            return None
+        snapshot = load_snapshot(tickers_file_path)
+        ensemble = _ensemble()
+        feature_engine.reload()
+        # Scores from another model version are not merged, rescore() or a refresh replaces them
+        if snapshot is None or snapshot.model_version != ensemble.version:
+            return None
+        missing = missing_tickers(tickers_file_path)
+        if not missing:
+            return 0
+        scores = dict(zip(snapshot.tickers, snapshot.predictions.tolist()))
+        for ticker, pred in zip(missing, infer_stocks.infer_stocks(missing, ensemble)):
+            if pred is not None:
+                scores[ticker] = pred
+        tickers = [ticker for ticker in _load_tickers(tickers_file_path) if ticker in scores]
+        if len(tickers) > len(snapshot):
+            _publish(tickers_file_path, snapshot.date, tickers, [scores[ticker] for ticker in tickers], ensemble.version)
+        return len(missing) - (len(tickers) - len(snapshot))
+
+def _rescore(tickers_file_path, snapshot):
+    """Re-scores snapshot's tickers with the active model from the feature engine's windows,
+    without downloading prices. Only called by the lease holder, False if windows are missing."""
+    import feature_engine
+    import infer_stock as infer_stocks
+    ensemble = _ensemble()
+    # This worker's engine may predate the refresh that produced snapshot
+    inputs, _, used = feature_engine.reload().features(list(snapshot.tickers))
+    if len(used) < len(snapshot):
+        # The engine does not hold every ticker's prices, leave it to a full refresh
+        return False
+    _publish(tickers_file_path, snapshot.date, used, infer_stocks.score_inputs(inputs, ensemble).tolist(), ensemble.version)
+    return True
+
+def rescore(tickers_file_path="tickers_test.txt"):
+    """Moves the current snapshot to the active model after a swap. True when done (or nothing
+    to do), False if the windows are missing, None if another worker holds the lease."""
+    import model_registry
+    _, _, lock_file_path = _paths(tickers_file_path)
+    with analysis_snapshot.refresh_lease(lock_file_path) as leader:
+        if not leader:
+            return None
+        snapshot = load_snapshot(tickers_file_path)
+        if snapshot is None or snapshot.model_version == model_registry.manifest_version():
+            return True
+        return _rescore(tickers_file_path, snapshot)
+
+def _wait_or_refresh(tickers_file_path):
+    """Loads the snapshot, refreshing it first (lease holder) or waiting for the worker that does"""
+    _, snapshot_file_path, lock_file_path = _paths(tickers_file_path)
+    # Latest trading day with a complete bar, weekends and holidays keep the previous session's analysis
+    as_of = market_calendar.calendar_for(tickers_file_path).latest_bar_day()
+
+    # With several uvicorn workers only the lease holder refreshes, the others
+    # wait for it to publish the snapshot (or take over if it died)
+    while True:
+        snapshot = analysis_snapshot.load_snapshot(snapshot_file_path)
+        if _is_current(snapshot, as_of):
+            return snapshot
+        with analysis_snapshot.refresh_lease(lock_file_path) as leader:
+            if leader:
+                snapshot = analysis_snapshot.load_snapshot(snapshot_file_path)
+                if not _is_current(snapshot, as_of):
+                    # After a model swap the day's prices are already in the feature engine
+                    if snapshot is None or snapshot.date < as_of or not _rescore(tickers_file_path, snapshot):
+                        _refresh(tickers_file_path, as_of)
+                    snapshot = analysis_snapshot.load_snapshot(snapshot_file_path)
+                return snapshot
+        cancellation.checkpoint()
+        time.sleep(0.5)
+
+
+class _SharedRefresh:
+    # One refresh thread per universe, shared by the jobs of this process that wait for it
+    def __init__(self):
+        self.token = cancellation.CancelToken()
+        self.done = threading.Event()
+        self.snapshot = None
+        self.error = None
+        self.waiters = 0
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def _run_shared(tickers_file_path, refresh):
+    try:
+        # The refresh's own token: the download and inference checkpoints stop it once no job waits
+        with cancellation.bound(refresh.token):
+            refresh.snapshot = _wait_or_refresh(tickers_file_path)
+    except Exception as e:
+        refresh.error = e
+    finally:
+        refresh.done.set()
+
+def _wait_shared(tickers_file_path):
+    """Snapshot from the shared refresh thread. The calling job only waits, so its cancel or
+    deadline frees it at once, and the refresh is aborted when the last waiting job leaves."""
+    with _shared_lock:
+        refresh = _shared.get(tickers_file_path)
+        if refresh is None or refresh.done.is_set() or refresh.token.cancelled:
+            refresh = _shared[tickers_file_path] = _SharedRefresh()
+            threading.Thread(target=_run_shared, args=(tickers_file_path, refresh),
+                             daemon=True, name="analysis-refresh").start()
+        refresh.waiters += 1
+    try:
+        while not refresh.done.wait(cancellation.timeout(0.5)):
+            cancellation.checkpoint()
+    finally:
+        with _shared_lock:
+            refresh.waiters -= 1
+            if refresh.waiters == 0 and not refresh.done.is_set():
+                refresh.token.cancel()
+    if refresh.error is not None:
+        raise refresh.error
+    return refresh.snapshot
+
+# Profiled under the name of the older entry point, which goes through here
+@profiling.profiled("get_latest_analysis")
+def get_latest_snapshot(tickers_file_path="tickers_test.txt"):
+    """Fresh Snapshot for the universe, refreshing it first if needed. Callers with a cancel
+    token (jobs) wait for a shared refresh thread, others (prewarm, scripts) refresh inline."""
+    start_time = time.time()
+    if cancellation.current() is not None:
+        snapshot = _wait_shared(tickers_file_path)
     else:
-        #print(f"No analysis found for {today}, creating new analysis")
-        # Load tickers from file for new analysis
-        with open(tickers_file_path, "r") as f:
-            tickers = [line.strip() for line in f if line.strip()]
-
-    # Run inference if today's data isn't available
-    if not os.path.exists(latest_analysis_file_path) or file_date != today:
-        #print(f"Running new analysis for {today}")
-        #tickers = ["ADFPL"]+tickers[:3]
-        preds = infer_stocks.infer_stocks(tickers)
-        results_df = pd.DataFrame({
-            'Date': [today] * len(tickers),
-            'Ticker': tickers,
-            'Prediction': preds,
-        })
-        # Filter out rows where Prediction is None
-        results_df = results_df.dropna(subset=['Prediction'])
-        results_df.to_csv(latest_analysis_file_path, index=False)
-        #print(f"Analysis saved to {latest_analysis_file_path}")
-
-    # Summary of results
-    #print("\nAnalysis Summary:")
-    #print(f"Number of tickers analyzed: {len(tickers)}")
-    #print("\nPredictions:")
-    #for ticker, pred in zip(tickers, preds):
-    #    print(f"{ticker}: {pred:.4f}")
+        snapshot = _wait_or_refresh(tickers_file_path)
 
     time_taken = time.time() - start_time
-    with open("time_taken.txt", "a") as f:
-        f.write(f"{time_taken:.9f}\n")
-
-    zipped = list(zip(tickers, preds))
-    filtered_zipped = []
-    for ticker, pred in zipped:
-        if pred is None:
-            continue
-        filtered_zipped.append((ticker, pred))
-    tickers, preds = zip(*filtered_zipped)
-    
-    return tickers, preds
+    analysis_snapshot.append_line(os.path.join(BASE_DIR, "time_taken.txt"), f"{time_taken:.9f}")
+
+    return snapshot
+
+def get_latest_analysis(tickers_file_path="tickers_test.txt"):
+    snapshot = get_latest_snapshot(tickers_file_path)
+    return snapshot.tickers, tuple(snapshot.predictions.tolist())
 
     # The function above will return the tickers and the predictions for the tickers
 
@@ -0,0 +1,152 @@
+import threading
+from bisect import bisect_left
+from collections import Counter
+import math
+
+import feature_engine
+import symbol_index
+import ticker_analysis
+
+# In-memory typeahead index over the tickers of the current analysis snapshot and their
+# company names: a sorted key array for prefix lookups (ticker, full name and each name
+# word) plus trigram postings for fuzzy matches. Fuzzy matching scores the query against
+# each term of an instrument (ticker, full name, each name word, also without punctuation)
+# and keeps its best term, so a typo in one word of a long name still matches.
+# Rebuilt only when the snapshot changes.
+
+FUZZY_THRESHOLD = 0.3
+
+
+def _trigrams(text):
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _alnum(text):
+    return "".join(c for c in text if c.isalnum())
+
+
+def _terms(ticker, name):
+    """Lower-case strings a fuzzy query is compared with, e.g. "coca-cola" and "cocacola" """
+    terms = {ticker}
+    if name:
+        words = name.split()
+        terms.update((name, _alnum(name)))
+        terms.update(words)
+        terms.update(_alnum(word) for word in words)
+    terms.discard("")
+    return terms
+
+
+class SearchIndex:
+    def __init__(self, tickers, predictions, names, date=None, stats=None):
+        self.date = date
+        self.tickers = list(tickers)
+        self.predictions = list(predictions)
+        # Cross-sectional stats from the snapshot, as lists aligned with tickers
+        self.stats = {field: values.tolist() for field, values in (stats or {}).items()}
+        self.names = [names.get(ticker) for ticker in self.tickers]
+        self.ticker_ids = {ticker.lower(): i for i, ticker in enumerate(self.tickers)}
+
+        keys = []
+        self.postings = {}      # trigram -> term ids
+        self.term_ids = []      # term id -> instrument
+        self.gram_counts = []   # term id -> number of trigrams
+        for i, (ticker, name) in enumerate(zip(self.tickers, self.names)):
+            keys.append((ticker.lower(), 0, i))
+            if name:
+                name = name.lower()
+                keys.append((name, 1, i))
+                keys.extend((word, 1, i) for word in name.split()[1:])
+            for term in _terms(ticker.lower(), name):
+                grams = _trigrams(term)
+                for gram in grams:
+                    self.postings.setdefault(gram, []).append(len(self.term_ids))
+                self.term_ids.append(i)
+                self.gram_counts.append(len(grams))
+        keys.sort()
+        self.keys = [key for key, _, _ in keys]
+        self.key_kinds = [kind for _, kind, _ in keys]
+        self.key_ids = [i for _, _, i in keys]
+
+    def _prefix(self, query):
+        lo = bisect_left(self.keys, query)
+        hi = bisect_left(self.keys, query + "\uffff")
+        return lo, hi
+
+    def _fuzzy(self, query):
+        grams = _trigrams(query)
+        counts = Counter(term for gram in grams for term in self.postings.get(gram, ()))
+        best = {}
+        for term, shared in counts.items():
+            # Jaccard similarity against this one term, the instrument keeps its best term
+            similarity = shared / (len(grams) + self.gram_counts[term] - shared)
+            i = self.term_ids[term]
+            if similarity >= FUZZY_THRESHOLD and similarity > best.get(i, 0):
+                best[i] = similarity
+        return sorted(best, key=lambda i: (-best[i], i))
+
+    def search(self, query, limit=10):
+        query = query.strip().lower()
+        if not query:
+            return []
+        found = []
+        seen = set()
+
+        def add(i):
+            if i not in seen:
+                seen.add(i)
+                found.append(i)
+
+        # Exact ticker, then ticker prefixes (shortest first), then name prefixes, then fuzzy
+        if query in self.ticker_ids:
+            add(self.ticker_ids[query])
+        lo, hi = self._prefix(query)
+        matches = sorted(range(lo, hi), key=lambda k: (self.key_kinds[k], len(self.keys[k])))
+        for k in matches:
+            add(self.key_ids[k])
+            if len(found) >= limit:
+                break
+        if len(found) < limit and len(query) >= 2:
+            for i in self._fuzzy(query):
+                add(i)
+                if len(found) >= limit:
+                    break
+
+        return [self._result(i) for i in found[:limit]]
+
+    def _result(self, i):
+        prediction = self.predictions[i]
+        result = {
+            "ticker": self.tickers[i],
+            "name": self.names[i],
+            "prediction": prediction if math.isfinite(prediction) else None,
+        }
+        for field, values in self.stats.items():
+            value = values[i]
+            result[field] = value if math.isfinite(value) else None
+        return result
+
+
+_index = None
+_index_snapshot = None
+_index_lock = threading.Lock()
+
+def get_index(tickers_file_path="tickers_test.txt"):
+    """Index for the current snapshot (stale is fine), None if there is no snapshot yet"""
+    global _index, _index_snapshot
+    snapshot = ticker_analysis.load_snapshot(tickers_file_path)
+    if snapshot is None:
+        return None
+    with _index_lock:
+        if snapshot is not _index_snapshot:
+            try:
+                names = symbol_index.names()
+            except Exception:
+                names = {}
+            stats = {"rank": snapshot.ranks, "percentile": snapshot.percentiles,
+                     "zscore": snapshot.zscores, "change": snapshot.changes,
+                     **{field: getattr(snapshot, field) for field in feature_engine.FEATURES}}
+            _index = SearchIndex(snapshot.tickers, snapshot.predictions.tolist(), names, snapshot.date, stats)
+            _index_snapshot = snapshot
+        return _index
@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+# Persistent per-ticker download status, so refreshes skip instruments that cannot be
+# scored (no orderbook mapping, too little history) and repairs only re-fetch transient failures.
+# A ticker that fails MAX_FAILURES times in a row is given up on for FAILED_RECHECK_DAYS.
+# Each thread keeps one connection, and a refresh batches its writes into one transaction.
+
+STATUS_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ticker_status.db")
+NO_MAPPING_RECHECK_DAYS = 7
+MAX_FAILURES = int(os.environ.get("TICKER_MAX_FAILURES", "5"))
+FAILED_RECHECK_DAYS = 7
+
+INELIGIBLE = "ineligible"
+FAILED = "failed"
+
+
+_local = threading.local()
+
+
+def _connect():
+    # sqlite3 connections belong to their thread, reopened if STATUS_DB_PATH was changed
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == STATUS_DB_PATH:
+        return conn
+    conn = sqlite3.connect(STATUS_DB_PATH, timeout=30)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS ticker_status (
+        ticker TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        reason TEXT,
+        ineligible_until TEXT,
+        retries INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT NOT NULL
+    )
+    ''')
+    _local.conn, _local.path = conn, STATUS_DB_PATH
+    return conn
+
+
+def _write(sql, params):
+    pending = getattr(_local, "pending", None)
+    if pending is not None:
+        pending.append((sql, params))
+        return
+    with _connect() as conn:
+        conn.execute(sql, params)
+
+
+@contextmanager
+def batch():
+    """Collects this thread's status writes and commits them in one transaction at the end,
+    also when the block raises (e.g. a cancelled download keeps what it learned)"""
+    if getattr(_local, "pending", None) is not None:
+        yield
+        return
+    _local.pending = []
+    try:
+        yield
+    finally:
+        pending, _local.pending = _local.pending, None
+        if pending:
+            with _connect() as conn:
+                for sql, params in pending:
+                    conn.execute(sql, params)
+
+
+def mark_ineligible(ticker, reason, until):
+    """Skip ticker in refreshes until the given date"""
+    _write('''
+    INSERT OR REPLACE INTO ticker_status (ticker, status, reason, ineligible_until, retries, updated_at)
+    VALUES (?, ?, ?, ?, 0, ?)
+    ''', (ticker, INELIGIBLE, reason, until.isoformat(), datetime.now(timezone.utc).isoformat()))
+
+
+def mark_no_mapping(ticker):
+    mark_ineligible(ticker, "No orderbook mapping", date.today() + timedelta(days=NO_MAPPING_RECHECK_DAYS))
+
+
+def mark_failed(ticker, reason):
+    """Transient failure, the ticker is retried by the next repair. After MAX_FAILURES in a row
+    it is ineligible for FAILED_RECHECK_DAYS, one more failure after that gives up again."""
+    until = (date.today() + timedelta(days=FAILED_RECHECK_DAYS)).isoformat()
+    _write('''
+    INSERT INTO ticker_status (ticker, status, reason, retries, updated_at) VALUES (?, ?, ?, 1, ?)
+    ON CONFLICT(ticker) DO UPDATE SET
+        status = CASE WHEN ticker_status.retries + 1 >= ? THEN ? ELSE excluded.status END,
+        reason = excluded.reason,
+        ineligible_until = CASE WHEN ticker_status.retries + 1 >= ? THEN ? ELSE NULL END,
+        retries = ticker_status.retries + 1, updated_at = excluded.updated_at
+    ''', (ticker, FAILED, reason, datetime.now(timezone.utc).isoformat(), MAX_FAILURES, INELIGIBLE, MAX_FAILURES, until))
+
+
+def mark_ok(ticker):
+    _write("DELETE FROM ticker_status WHERE ticker = ?", (ticker,))
+
+
+def ineligible_tickers(today=None):
+    """Tickers that are still ineligible on today"""
+    today = today or date.today()
+    with _connect() as conn:
+        rows = conn.execute("SELECT ticker FROM ticker_status WHERE status = ? AND ineligible_until > ?",
+                            (INELIGIBLE, today.isoformat())).fetchall()
+    return {ticker for ticker, in rows}
+
+
+def get_statuses():
+    with _connect() as conn:
+        rows = conn.execute("SELECT ticker, status, reason, ineligible_until, retries, updated_at FROM ticker_status").fetchall()
+    return [dict(zip(("ticker", "status", "reason", "ineligible_until", "retries", "updated_at"), row)) for row in rows]
@@ -0,0 +1,52 @@
+import threading
+import time
+from collections import OrderedDict
+from jose import jwt
+
+# LRU cache of verified JWT claims. An entry never outlives the token's exp claim,
+# so a cached token is rejected exactly when jwt.decode would start rejecting it.
+
+MAX_ENTRIES = 10000
+MAX_TTL_SECONDS = 300  # For tokens without exp
+
+
+class TokenCache:
+    def __init__(self, secret, algorithms, max_entries=MAX_ENTRIES, max_ttl=MAX_TTL_SECONDS):
+        self.secret = secret
+        self.algorithms = algorithms
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def decode(self, token):
+        """Same as jwt.decode(token, secret, algorithms), raises JWTError for invalid tokens"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                claims, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(token)
+                    self.hits += 1
+                    return claims
+                del self._entries[token]
+            self.misses += 1
+
+        claims = jwt.decode(token, self.secret, algorithms=self.algorithms)
+        expires_at = now + self.max_ttl
+        if isinstance(claims.get("exp"), (int, float)):
+            expires_at = min(expires_at, claims["exp"])
+
+        with self._lock:
+            self._entries[token] = (claims, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return claims
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
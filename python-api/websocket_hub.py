@@ -0,0 +1,148 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+# WebSocket subscribers of one process. Broadcasts are serialized once and queued per
+# connection with a byte budget; a connection only has a sender task while it has
+# something queued, so an idle subscriber costs its socket and one small object.
+# The hub pings subscribers that have been quiet for WS_HEARTBEAT_SECONDS ({"type": "ping"},
+# any message back counts as a pong) and evicts those silent for WS_IDLE_TIMEOUT_SECONDS.
+# Connections are also dropped on any send failure or when their queue exceeds
+# WS_MAX_PENDING_BYTES (a client that does not read).
+
+WS_HEARTBEAT_SECONDS = float(os.environ.get("WS_HEARTBEAT_SECONDS", "30"))
+WS_IDLE_TIMEOUT_SECONDS = float(os.environ.get("WS_IDLE_TIMEOUT_SECONDS", "90"))
+WS_MAX_PENDING_BYTES = int(os.environ.get("WS_MAX_PENDING_BYTES", "65536"))
+WS_MAX_INBOUND_BYTES = int(os.environ.get("WS_MAX_INBOUND_BYTES", "4096"))
+WS_SEND_TIMEOUT_SECONDS = 10
+
+# uvicorn settings that bound what the protocol layer holds per connection. Per-message
+# deflate keeps a zlib context per connection, far more than the small JSON updates need.
+SERVER_OPTIONS = {
+    "ws_max_size": WS_MAX_INBOUND_BYTES,
+    "ws_max_queue": 4,
+    "ws_per_message_deflate": os.environ.get("WS_PER_MESSAGE_DEFLATE", "0") == "1",
+}
+
+PING = json.dumps({"type": "ping"})
+
+
+class Subscriber:
+    __slots__ = ("websocket", "client_id", "user_id", "last_seen", "outbox", "pending_bytes", "sending", "closed")
+
+    def __init__(self, websocket, client_id, user_id):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.user_id = user_id
+        self.last_seen = time.monotonic()
+        self.outbox = None  # deque of queued texts, created on first send
+        self.pending_bytes = 0
+        self.sending = False
+        self.closed = False
+
+
+class Hub:
+    def __init__(self):
+        self.clients = {}  # client_id -> [Subscriber], a client may have several tabs open
+        self.count = 0
+        self.evicted = 0
+        self.loop = None
+
+    def start(self, loop):
+        """Binds the hub to the server's event loop and starts the heartbeat"""
+        self.loop = loop
+        loop.create_task(self._heartbeat())
+
+    def add(self, websocket, client_id, user_id):
+        subscriber = Subscriber(websocket, client_id, user_id)
+        self.clients.setdefault(client_id, []).append(subscriber)
+        self.count += 1
+        return subscriber
+
+    def remove(self, subscriber):
+        if subscriber.closed:
+            return
+        subscriber.closed = True
+        subscriber.outbox = None
+        self.count -= 1
+        connections = self.clients.get(subscriber.client_id)
+        if connections is not None:
+            connections.remove(subscriber)
+            if not connections:
+                del self.clients[subscriber.client_id]
+
+    def subscribers(self):
+        # A copy, so connections can come and go while it is iterated
+        return [subscriber for connections in list(self.clients.values()) for subscriber in connections]
+
+    def send(self, subscriber, message):
+        self._enqueue(subscriber, message if isinstance(message, str) else json.dumps(message))
+
+    def publish(self, message):
+        """Queues message for every subscriber, must run on the hub's loop"""
+        text = json.dumps(message)
+        for subscriber in self.subscribers():
+            self._enqueue(subscriber, text)
+
+    def publish_threadsafe(self, message):
+        """publish() from any thread, returns without waiting for the sends"""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.publish, message)
+
+    def _enqueue(self, subscriber, text):
+        if subscriber.closed:
+            return
+        size = len(text)
+        if subscriber.pending_bytes + size > WS_MAX_PENDING_BYTES:
+            self.evict(subscriber, 1013, "Too many pending messages")
+            return
+        if subscriber.outbox is None:
+            subscriber.outbox = deque()
+        subscriber.outbox.append(text)
+        subscriber.pending_bytes += size
+        if not subscriber.sending:
+            subscriber.sending = True
+            asyncio.get_running_loop().create_task(self._drain(subscriber))
+
+    async def _drain(self, subscriber):
+        try:
+            while subscriber.outbox:
+                text = subscriber.outbox[0]
+                await asyncio.wait_for(subscriber.websocket.send_text(text), WS_SEND_TIMEOUT_SECONDS)
+                if subscriber.outbox:
+                    subscriber.outbox.popleft()
+                subscriber.pending_bytes -= len(text)
+            subscriber.outbox = None  # Idle subscribers do not keep an empty deque around
+        except Exception:
+            self.evict(subscriber, 1011, "Send failed")
+        finally:
+            subscriber.sending = False
+
+    def evict(self, subscriber, code, reason):
+        if subscriber.closed:
+            return
+        self.remove(subscriber)
+        self.evicted += 1
+        asyncio.get_running_loop().create_task(self._close(subscriber.websocket, code, reason))
+
+    async def _close(self, websocket, code, reason):
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), WS_SEND_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(min(WS_HEARTBEAT_SECONDS, WS_IDLE_TIMEOUT_SECONDS) / 2)
+            now = time.monotonic()
+            for subscriber in self.subscribers():
+                quiet = now - subscriber.last_seen
+                if quiet >= WS_IDLE_TIMEOUT_SECONDS:
+                    self.evict(subscriber, 1001, "Idle timeout")
+                elif quiet >= WS_HEARTBEAT_SECONDS and not subscriber.sending:
+                    self._enqueue(subscriber, PING)
+
+    def stats(self):
+        return {"connections": self.count, "clients": len(self.clients), "evicted": self.evicted}
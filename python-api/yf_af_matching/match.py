@@ -1,76 +1,48 @@
-import json
-import glob
 import os
-import re
-import random
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
-
-stock_data = []
-
-# Get all json files in current directory
-json_files = glob.glob("orderBookIds/*.json")
-
-
-sp_500_tickers = []
-sp_500_ticker_to_af_id = {}
-af_id_to_sp_500_ticker = {}
-
-with open('tickers_test.txt', 'r') as f:
-    for line in f:
-        sp_500_tickers.append(line.strip())
-
-match_count = 0
-for file in json_files:
-    try:
-        # Extract ID from filename
-        order_book_id = file.split('.')[0].split('/')[-1]
-        
-        # Load and parse JSON
-        with open(file, 'r') as f:
-            data = json.load(f)
-            
-        # Check if it's a US stock
-        if data.get('type') == 'STOCK' and data.get('flagCode') == 'US':
-            title = data.get('title')
-            
-            # Check for ticker in parentheses
-            ticker_match = re.search(r'\(([A-Z]+(?:[-.][A-Z])?)\)', title)
-            if ticker_match:
-                ticker = ticker_match.group(1)
-            elif re.match(r'^[A-Z]{1,7}$', title):
-                ticker = title
-            else:
-                print(f"WARNING NOT FOUND: No ticker found in parentheses for {title}")
-                ticker = None
-            if title:  # Only add if title exists
-                stock_data.append((order_book_id, title, ticker))
-
-            if ticker in sp_500_tickers:
-                match_count += 1
-                sp_500_ticker_to_af_id[ticker] = order_book_id
-                af_id_to_sp_500_ticker[order_book_id] = ticker
-                
-    except Exception as e:
-        print(f"Error processing file {file}: {str(e)}")
-
-# Sort by ID for consistency
-stock_data.sort(key=lambda x: int(x[0]))
-
-print(f"{len(stock_data)} items found")
-print(f"{match_count} matches found")
-# Print first 50 items
-
-# Save the ticker-to-id mappings
-with open('sp500_ticker_to_af_id.json', 'w') as f:
-    json.dump(sp_500_ticker_to_af_id, f, indent=4)
-
-with open('af_id_to_sp500_ticker.json', 'w') as f:
-    json.dump(af_id_to_sp_500_ticker, f, indent=4)
-
-exit()
-random.shuffle(stock_data)
-for i, (id, title, ticker) in enumerate(stock_data[:50]):
-    print(f"{id}:{ticker}")
-
-
-
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import symbol_index
+
+# Adds the orderbook dumps in orderBookIds/ to the symbol index (symbols.db).
+# Only new or changed files are parsed, in parallel, and rows of removed files are dropped.
+#
+# Rows seeded from the old ticker mapping have no name or ISIN. --reference fills those in
+# from the index constituents in pytickersymbols (pip install pytickersymbols), which is how
+# the shipped symbols.db got its names, the orderbook dumps are not in the repository.
+#
+#   python match.py [DUMP_DIR] [--reference]
+
+
+def reference_entries():
+    """(ticker, name, isin) for US index constituents, under both BRK.B and BRK-B spellings"""
+    from pytickersymbols import PyTickerSymbols
+    stocks = PyTickerSymbols()
+    entries = {}
+    for index in ("S&P 500", "S&P 100", "S&P 600", "NASDAQ 100", "DOW JONES"):
+        for stock in stocks.get_stocks_by_index(index):
+            isins = stock.get("isins") or [None]
+            for ticker in {stock["symbol"], stock["symbol"].replace("-", "."), stock["symbol"].replace(".", "-")}:
+                entries.setdefault(ticker, (ticker, stock["name"], isins[0]))
+    return list(entries.values())
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--reference"]
+    dump_dir = args[0] if args else os.path.join(os.path.dirname(os.path.abspath(__file__)), "orderBookIds")
+    start = time.time()
+    parsed = symbol_index.build_index(dump_dir)
+    print(f"{parsed} orderbook files parsed in {time.time() - start:.1f}s")
+    if "--reference" in sys.argv[1:]:
+        print(f"{symbol_index.import_reference(reference_entries())} rows got a name or ISIN from pytickersymbols")
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tickers_test.txt'), 'r') as f:
+        tickers = [line.strip() for line in f if line.strip()]
+    match_count = sum(1 for ticker in tickers if symbol_index.orderbook_id(ticker) is not None)
+    print(f"{match_count} of {len(tickers)} tickers matched")
+    # Name and fuzzy search (ticker_search) only work if the index has company names
+    name_count = len(symbol_index.names())
+    print(f"{name_count} stocks have a name")
+    if name_count == 0:
+        sys.exit("The symbol index has no company names, run with --reference or add orderbook dumps")
@@ -48,6 +48,17 @@ const useWebSocketStore = create((set, get) => ({
         set({ socket: newSocket, connected: true, error: null });
       };
       
+      // Answer the server's heartbeat, it closes connections that stay silent
+      newSocket.addEventListener('message', (event) => {
+        try {
+          if (JSON.parse(event.data).type === 'ping') {
+            newSocket.send(JSON.stringify({ type: 'pong' }));
+          }
+        } catch (error) {
+          // Not JSON, nothing to answer
+        }
+      });
+      
       newSocket.onclose = () => {
         console.log('WebSocket disconnected');
         set({ connected: false });